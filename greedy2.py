@@ -4,12 +4,83 @@ import pandas as pd
 import time
 import cProfile, pstats, io
 from pstats import SortKey
+from collections import deque, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+
+# model settings that greedy2 changes at runtime
+# and that have to be passed to the worker processes
+worker_settings = ['obj', 'min_vehicles', 'TimeLimit', 'MIPFocus', 
+                   'method', 'MIPGap', 'CutPasses', 'threads']
+# my_sk instance of a worker process, see init_worker()
+worker_sk = None
+
+
+def init_worker(config, full_data, log_file):
+    '''
+    Initialize a worker process of the candidate pool 
+    with its own model of the instance.
+
+    Args:
+        config (str): path to YAML
+        full_data (pd.DataFrame): scored data of all vehicles
+        log_file (str): logfile of the main process, 
+                        the worker logs to a file next to it
+    '''
+    global worker_sk
+    worker_sk = my_sk(config, out_dir=os.path.dirname(log_file))
+    worker_sk.vehicle_data = full_data
+    worker_sk.full_data = full_data
+    worker_sk.LogToConsole = False
+    root, ext = os.path.splitext(log_file)
+    worker_sk.LogFile = '{}_w{}{}'.format(root, os.getpid(), ext)
+    if worker_sk.h_persistent:
+        worker_sk.preprocess()
+
+
+def run_worker(v_set, settings, starts):
+    '''
+    Solve the model for a vehicle set in a worker process.
+
+    Args:
+        v_set (list): indices of the vehicles to be used
+        settings (dict): values of worker_settings
+        starts (tuple): warm-starts for f, w, s_n and s_v
+    Returns:
+        relaxed (probe_result): result of the LP relaxation, 
+                                None if sk.h_relax is not set
+        result (probe_result): outcome and runtime of the probe, 
+                               None if decided by the relaxation
+        starts (tuple): variable values if feasible, else None
+    '''
+    sk = worker_sk
+    for key, value in settings.items():
+        setattr(sk, key, value)
+    sk.vehicle_data = sk.full_data.iloc[v_set, :]
+    if sk.h_persistent:
+        sk.active_vehicles = v_set
+    else:
+        sk.preprocess()
+    relaxed = None
+    if sk.h_relax:
+        relaxed = sk.check_relaxation()
+        if relaxed.status == INFEASIBLE:
+            return relaxed, None, None
+    result = sk.check_feasibility(*starts)
+    if result.status == FEASIBLE:
+        return relaxed, result, read_variables(sk.mod, sk.grb_vars)
+
+    return relaxed, result, None
 
 
 class greedy2():
-    def __init__(self, config):
-        self.sk = my_sk(config) 
-        self.logfile = os.path.join('output', 
+    def __init__(self, config, out_dir='output', workers=None):
+        self.config = config
+        self.sk = my_sk(config, out_dir=out_dir) 
+        if workers is not None:
+            self.sk.h_workers = workers
+        self.logfile = os.path.join(self.sk.out_dir, 
                                     self.sk.time_str+'_hlog.txt')
         log_str = 'Instance: {}'.format(self.sk.instance_str)
         log_str += '\nProblem parameters: \n{} vehicles'.format(
@@ -30,6 +101,8 @@ class greedy2():
         self.t_eff = self.full_data['theta_eff']
         self.names = self.full_data['name']
         self.costs = self.full_data['costs']
+        # current vehicle set, see v_set
+        self.v_pool = vehicle_pool(self.full_data['score'])
         self.stats = {'iter': 0, 
                       'inf': 0, 
                       'inf_time': 0., 
@@ -38,16 +111,64 @@ class greedy2():
                       'feas_times': [], 
                       'tlimit': 0,
                       'tlimit_time': 0.,
-                      'blacklist_found': 0}
-        self.f_start = None
-        self.w_start = None
+                      'retry': 0,
+                      'retry_time': 0.,
+                      'screened': 0,
+                      'relax': 0,
+                      'relax_inf': 0,
+                      'relax_time': 0.,
+                      'blacklist_found': 0,
+                      'unknown_found': 0,
+                      'cache_found': 0}
+        # warm-starts of vehicles by identity (index of full_data), 
+        # see store_starts() and get_starts()
+        self.v_starts = None
         self.s_n_start = None
-        self.s_v_start = None
-        self.blacklist = []
+        self.s_v0 = self.sk.get_s_v0(self.full_data)
+        # vehicles of the same name are considered interchangeable
+        self.cache = feasibility_cache(self.names)
+        # sets without result within the time limit, 
+        # see record() and retry_unknown()
+        self.unknown = {}
+        # necessary conditions checked before each probe
+        self.screen = feasibility_screen(self.sk, self.full_data)
         self.profiler = cProfile.Profile()
         self.profiler.enable()
-        self.feas_grb_mod = None
         self.obj_progress = []
+        if self.sk.h_persistent:
+            # build data for the full fleet only once, 
+            # see set_vehicles()
+            self.write_log('Using persistent model of full fleet')
+            self.sk.preprocess()
+        # feasibility checks running in the background, 
+        # see lookahead()
+        self.pool = None
+        self.pending = {}
+        if self.sk.h_workers > 1:
+            self.write_log('Checking {} candidates in parallel'.format(
+                           self.sk.h_workers))
+            # spawn fresh processes instead of forking 
+            # the gurobi environment of this one
+            self.pool = ProcessPoolExecutor(
+                        max_workers=self.sk.h_workers, 
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=init_worker,
+                        initargs=(config, self.full_data, 
+                                  self.sk.LogFile))
+
+
+    @property
+    def v_set(self):
+        '''
+        Indices of the vehicles in the current set (a copy), 
+        assignment replaces the set of self.v_pool.
+        '''
+        return self.v_pool.get_set()
+
+
+    @v_set.setter
+    def v_set(self, v_set):
+        self.v_pool.reset(v_set)
 
 
     def quick_init(self): 
@@ -66,14 +187,14 @@ class greedy2():
                                                   ascending=False)
         v_set = v_data.index.tolist()
         self.sk.TimeLimit = self.__time_limit__
-        grb_mod = self.run_model(v_set)
-        if grb_mod.status == 2:
+        result = self.check_set(v_set)
+        if result.status == FEASIBLE:
             feas_set = v_set.copy()
             ub = len(v_set)-1
             lb = 0
             self.sk.TimeLimit = self.sk.h_init_time_limit
             self.write_log('Full set feasible! ({:.2f} s)'.format(
-                grb_mod.Runtime))
+                result.runtime))
             ind = int(lb+(ub-lb)/2)
         else:
             self.write_log('Full set not feasible, exiting...')
@@ -82,15 +203,15 @@ class greedy2():
             tmp_set = v_set[:ind+1].copy()
             self.write_log('Trying {}<---{}-->{}'.format(
                             lb,ind,ub))
-            grb_mod = self.run_model(tmp_set)
-            if grb_mod.status == 2:
+            result = self.check_set(tmp_set)
+            if result.status == FEASIBLE:
                 self.write_log('Feasible! ({:.2f} s)'.format(
-                                grb_mod.Runtime))
+                                result.runtime))
                 ub = len(tmp_set)-1
                 feas_set = tmp_set.copy()
             else:
                 self.write_log('Infeasible! ({:.2f} s)'.format(
-                                grb_mod.Runtime))
+                                result.runtime))
                 lb = len(tmp_set)-1
             ind = int(lb+(ub-lb)/2)
 
@@ -113,22 +234,20 @@ class greedy2():
         '''
         v_set, log_str = init_set(self.sk)
         self.write_log(log_str)
+        self.v_set = v_set
 
-        grb_mod = self.run_model(v_set)
+        result = self.check_set(v_set)
         costs = self.sk.vehicle_data['costs'].sum()
-        if grb_mod.status==2:
+        if result.status == FEASIBLE:
             log_str = '\nInitial set feasible! ({})'.format(costs)
             log_str += ' -> Try to remove vehicles...'
             infeasible = False
         else:
             infeasible = True
-            name_list = [self.names[i] for i in v_set]
-            name_list.sort()
-            self.blacklist.append(name_list)
-            if grb_mod.status == 3:
+            if result.status == INFEASIBLE:
                 log_str = '\nInitial set infeasible! ' \
                           '-> Try to add vehicles...'
-            elif grb_mod.status == 9:
+            else:
                 log_str = '\nTime limit reached, ' \
                           'assuming infeasibility! ' \
                           '-> Try to add vehicles...'
@@ -136,20 +255,17 @@ class greedy2():
         
         if infeasible:
             while infeasible:
-                v_set, log = add_greedy(self.full_data, v_set)
+                v_set, log = add_greedy(self.full_data, self.v_pool)
                 self.write_log(log)
                 if v_set is None:
                     exit()
-                grb_mod = self.run_model(v_set)
-                if grb_mod.status==2:
+                result = self.check_set(v_set)
+                if result.status == FEASIBLE:
                     infeasible=False
                 else:
-                    name_list = [self.names[i] for i in v_set]
-                    name_list.sort()
-                    self.blacklist.append(name_list)
-                    if grb_mod.status==3:
+                    if result.status == INFEASIBLE:
                         self.write_log('Still infeasible!')  
-                    elif grb_mod.status==9:
+                    else:
                         self.write_log(
                             'Time limit of {}'.format(
                             self.sk.TimeLimit) + 
@@ -157,10 +273,10 @@ class greedy2():
         else:
             tmp_set = v_set.copy()
             while not infeasible:
-                v_set, log = remove_greedy(self.full_data, v_set)
+                v_set, log = remove_greedy(self.full_data, self.v_pool)
                 self.write_log(log)
-                grb_mod = self.run_model(v_set)
-                if grb_mod.status==2:
+                result = self.check_set(v_set)
+                if result.status == FEASIBLE:
                     tmp_set = v_set.copy()
                     costs = self.sk.vehicle_data['costs'].sum()
                     self.write_log('Still feasible') 
@@ -168,15 +284,12 @@ class greedy2():
                                    costs)) 
                     self.write_log('Keep removing...')
                 else:
-                    name_list = [self.names[i] for i in v_set]
-                    name_list.sort()
-                    self.blacklist.append(name_list)
                     infeasible = True
                     v_set = tmp_set
-                    if grb_mod.status==3:
+                    if result.status == INFEASIBLE:
                         self.write_log('Infeasible! ' + 
                                        'Use previous set...')
-                    if grb_mod.status==9:
+                    else:
                         self.write_log('Time limit of {}'.format(
                                        self.sk.TimeLimit) + 
                                        'seconds reached!')
@@ -212,34 +325,402 @@ class greedy2():
             log.write(log_str)
 
 
+    def set_vehicles(self, v_set):
+        '''
+        Prepare the model for a vehicle set.
+        If sk.h_persistent is set, the model of the full fleet 
+        is reused and vehicles not in v_set are only switched 
+        off via variable bounds, otherwise the model is built 
+        from scratch for v_set.
+        '''
+        self.sk.vehicle_data = self.full_data.iloc[v_set, :]
+        if self.sk.h_persistent:
+            self.sk.active_vehicles = v_set
+        else:
+            self.sk.preprocess()
+
+
     def run_model(self, v_set):
         '''
-        Run GRB-model and update statistics
+        Solve GRB-model of a vehicle set with sk.obj 
+        to completion, warm-started from the last feasible set.
+        The model is built for v_set only, even if sk.h_persistent 
+        is set, i.e. the solution contains only the vehicles used.
         '''
-        self.stats['iter'] += 1
+        f_start, w_start, s_n_start, s_v_start = self.get_starts(
+                                            v_set, persistent=False)
         self.sk.vehicle_data = self.full_data.iloc[v_set, :]
+        self.sk.active_vehicles = None
         self.sk.preprocess()
-        grb_mod = self.sk.solve(f_start=self.f_start, 
-                                w_start=self.w_start, 
-                                s_n_start=self.s_n_start, 
-                                s_v_start=self.s_v_start)
-        
-        if grb_mod.status == 2:
-            self.feas_grb_mod = grb_mod.copy()
-            self.f_start, self.w_start, self.s_n_start, self.s_v_start = read_variables(grb_mod)
+        grb_mod = self.sk.solve(f_start=f_start, 
+                                w_start=w_start, 
+                                s_n_start=s_n_start, 
+                                s_v_start=s_v_start)
+
+        return grb_mod
+
+
+    def check_set(self, v_set):
+        '''
+        Probe feasibility of a vehicle set, i.e. stop at the 
+        first feasible solution, and update statistics.
+
+        Returns:
+            result (probe_result): outcome and runtime of the probe
+        '''
+        if self.screen_set(v_set):
+            return probe_result(INFEASIBLE, 0.)
+        self.set_vehicles(v_set)
+        if self.sk.h_relax:
+            relaxed = self.sk.check_relaxation()
+            self.record(v_set, relaxed)
+            if relaxed.status == INFEASIBLE:
+                self.write_log('Relaxation infeasible!')
+                return relaxed
+        result = self.sk.check_feasibility(*self.get_starts(v_set))
+        starts = None
+        if result.status == FEASIBLE:
+            starts = read_variables(self.sk.mod, self.sk.grb_vars)
             self.sum_costs = self.sk.vehicle_data['costs'].sum()
+        self.record(v_set, result, starts)
+
+        return result
+
+
+    def record(self, v_set, result, starts=None):
+        '''
+        Update statistics, feasibility cache and warm-starts 
+        with the result of a feasibility probe or relaxation.
+
+        Args:
+            v_set (list): indices of the vehicles used
+            result (probe_result): outcome and runtime of the probe
+            starts (tuple): variable values of a feasible solution, 
+                            kept as warm-starts if given
+        '''
+        if result.relaxed:
+            self.stats['relax'] += 1
+            self.stats['relax_time'] += result.runtime
+            if result.status == INFEASIBLE:
+                self.cache.add(v_set, False)
+                self.stats['relax_inf'] += 1
+            return
+        self.stats['iter'] += 1
+        key = self.cache.get_key(v_set)
+        if result.status == FEASIBLE:
+            self.cache.add(v_set, True)
+            self.unknown.pop(key, None)
+            if starts is not None:
+                self.store_starts(starts, v_set)
             self.stats['feas'] += 1
-            self.stats['feas_time'] += grb_mod.Runtime
+            self.stats['feas_time'] += result.runtime
             self.stats['feas_times'].append('{:.2f}'.format(
-                                            grb_mod.Runtime))
-        elif grb_mod.status == 3:
+                                            result.runtime))
+        elif result.status == INFEASIBLE:
+            self.cache.add(v_set, False)
+            self.unknown.pop(key, None)
             self.stats['inf'] += 1
-            self.stats['inf_time'] += grb_mod.Runtime
-        elif grb_mod.status == 9:
+            self.stats['inf_time'] += result.runtime
+        else:
+            # no result within time limit, keep the set and the 
+            # time limit tried for retry_unknown()
+            self.unknown[key] = (list(v_set), self.sk.TimeLimit)
             self.stats['tlimit'] += 1
-            self.stats['tlimit_time'] += grb_mod.Runtime
+            self.stats['tlimit_time'] += result.runtime
 
-        return grb_mod
+
+    def screen_set(self, v_set):
+        '''
+        Reject a vehicle set without solving the model, 
+        if it violates a necessary condition of feasibility_screen.
+
+        Args:
+            v_set (list): indices of the vehicles to be used
+        Returns:
+            infeasible (bool): True if v_set is provably infeasible
+        '''
+        reason = self.screen.check(v_set)
+        if reason is None:
+            return False
+        self.cache.add(v_set, False)
+        self.stats['screened'] += 1
+        self.write_log('Infeasible by {}!'.format(reason))
+
+        return True
+
+
+    def skip(self, v_set):
+        '''
+        Check whether probing a vehicle set can be skipped, 
+        since it is known to be infeasible or it ran into 
+        the current time limit before.
+
+        Args:
+            v_set (list): indices of the vehicles to be used
+        Returns:
+            skip (bool): True if v_set should not be probed
+        '''
+        if self.cache.check(v_set) is False:
+            self.stats['blacklist_found'] += 1
+            return True
+        unknown = self.unknown.get(self.cache.get_key(v_set))
+        if unknown is not None and unknown[1] >= self.sk.TimeLimit:
+            self.stats['unknown_found'] += 1
+            return True
+
+        return False
+
+
+    def retry_unknown(self, max_time):
+        '''
+        Retry sets that ran into the time limit and are cheaper 
+        than the current set, cheapest first. The time limit of 
+        a set grows by the factor sk.h_retry_factor with each 
+        retry. Called when the search stalls otherwise.
+
+        Args:
+            max_time (int): maximum time limit in seconds 
+                            for retries
+        Returns:
+            set_changed (bool): True if a cheaper set was found
+        '''
+        start = time.time()
+        curr_costs = self.costs[self.v_set].sum()
+        candidates = sorted(self.unknown.values(), 
+                            key=lambda item: self.costs[item[0]].sum())
+        time_limit = self.sk.TimeLimit
+        set_changed = False
+        for v_set, tried_limit in candidates:
+            costs = self.costs[v_set].sum()
+            time_left = max_time - (time.time()-start)
+            if costs >= curr_costs or time_left <= 0:
+                break
+            self.sk.TimeLimit = min(tried_limit * self.sk.h_retry_factor, 
+                                    time_left)
+            self.write_log('Retry {} ({}) with time limit {:.1f}'.format(
+                           v_set, costs, self.sk.TimeLimit))
+            feasible, runtime = self.probe(v_set)
+            self.stats['retry'] += 1
+            self.stats['retry_time'] += runtime
+            if feasible:
+                self.v_set = v_set
+                self.sum_costs = costs
+                self.write_log('Feasible! (Runtime: {:.2f})'.format(
+                                runtime))
+                self.write_log('New set: {}\n ### {} ###'.format(
+                                self.v_set, self.sum_costs))
+                set_changed = True
+                break
+        self.sk.TimeLimit = time_limit
+        self.sk.vehicle_data = self.full_data.iloc[self.v_set]
+
+        return set_changed
+
+
+    def store_starts(self, starts, v_set):
+        '''
+        Keep the solution of a feasible vehicle set as warm-start. 
+        Schedules are stored by vehicle identity, since vehicle 
+        indices of the model are positions within v_set unless 
+        sk.h_persistent is set.
+
+        Args:
+            starts (tuple): f, w, s_n and s_v from read_variables()
+            v_set (list): indices of the vehicles used
+        '''
+        f_vnt, w_vnmt, s_nt, s_vt = starts
+        if self.sk.h_persistent:
+            identity = {v: v for v in v_set}
+        else:
+            identity = dict(enumerate(v_set))
+        # non-zero values of f, w and s_v by vehicle identity
+        self.v_starts = {v: ([], [], []) for v in v_set}
+        for i, values in enumerate([f_vnt, w_vnmt, s_vt]):
+            for ind, val in values.items():
+                if val != 0 and ind[0] in identity:
+                    self.v_starts[identity[ind[0]]][i].append(
+                                                  (ind[1:], val))
+        self.s_n_start = s_nt
+
+
+    def get_starts(self, v_set, persistent=None):
+        '''
+        Return warm-starts for the model of a vehicle set. 
+        Vehicles of the last feasible solution keep their 
+        schedules, all other vehicles are parked at the first 
+        depot with constant soc, which is how switched off 
+        vehicles behave anyway.
+
+        Args:
+            v_set (list): indices of the vehicles to be used
+            persistent (bool): model of the full fleet, 
+                               default: sk.h_persistent
+        Returns:
+            f_start, w_start, s_n_start, s_v_start (defaultdict): 
+                warm-starts, zero for indices not contained
+        '''
+        if self.v_starts is None:
+            return None, None, None, None
+        if persistent is None:
+            persistent = self.sk.h_persistent
+        if persistent:
+            # model contains the full fleet
+            positions = [(v, v) for v in self.full_data.index]
+        else:
+            positions = list(enumerate(v_set))
+        active = set(v_set)
+        depot = self.sk.depots[0]
+        times = self.sk.times
+        f_start = defaultdict(float)
+        w_start = defaultdict(float)
+        s_v_start = defaultdict(float)
+        for i, v in positions:
+            if v in active and v in self.v_starts:
+                f_vals, w_vals, s_v_vals = self.v_starts[v]
+                f_start.update(((i,) + ind, val) for ind, val in f_vals)
+                w_start.update(((i,) + ind, val) for ind, val in w_vals)
+                s_v_start.update(((i,) + ind, val) 
+                                 for ind, val in s_v_vals)
+            else:
+                for t in times[:-1]:
+                    w_start[i, depot, depot, t] = 1.
+                for t in times[1:]:
+                    s_v_start[i, t] = self.s_v0[v]
+
+        return f_start, w_start, self.s_n_start, s_v_start
+
+
+    def probe(self, v_set):
+        '''
+        Check feasibility of a vehicle set. Sets that contain 
+        a feasible set are accepted without calling gurobi, 
+        otherwise the model is probed via check_set() or, 
+        if a worker pool is used, by one of the workers.
+
+        Returns:
+            feasible (bool): True if v_set is feasible
+            runtime (float): runtime of gurobi
+        '''
+        if self.cache.check(v_set):
+            self.stats['cache_found'] += 1
+            self.sum_costs = self.costs[v_set].sum()
+            self.write_log('Contains a feasible set!')
+            return True, 0.
+        if self.pool is None:
+            result = self.check_set(v_set)
+            return (result.status == FEASIBLE), result.runtime
+        if self.screen_set(v_set):
+            return False, 0.
+        
+        self.submit(v_set)
+        future = self.pending.pop(tuple(sorted(v_set)), None)
+        if future is None:
+            result = self.check_set(v_set)
+            return (result.status == FEASIBLE), result.runtime
+        relaxed, result, starts = future.result()
+        if relaxed is not None:
+            self.record(v_set, relaxed)
+        if result is None:
+            self.write_log('Relaxation infeasible!')
+            return False, relaxed.runtime
+        self.record(v_set, result, starts)
+        if result.status == FEASIBLE:
+            self.sum_costs = self.costs[v_set].sum()
+
+        return (result.status == FEASIBLE), result.runtime
+
+
+    def submit(self, v_set):
+        '''
+        Start the feasibility check of a vehicle set in the 
+        worker pool, unless it is running already, its 
+        feasibility is known or it ran into the current 
+        time limit before.
+
+        Args:
+            v_set (list): indices of the vehicles to be used
+        '''
+        key = tuple(sorted(v_set))
+        unknown = self.unknown.get(self.cache.get_key(v_set))
+        if (self.pool is None or key in self.pending 
+            or self.cache.check(v_set) is not None 
+            or (unknown is not None and unknown[1] >= self.sk.TimeLimit)
+            or self.screen.check(v_set) is not None):
+            return
+        settings = {name: getattr(self.sk, name) 
+                    for name in worker_settings}
+        starts = self.get_starts(v_set)
+        self.pending[key] = self.pool.submit(run_worker, list(v_set), 
+                                             settings, starts)
+
+
+    def flush(self):
+        '''
+        Cancel feasibility checks that have not started yet 
+        and record the results of finished ones in the cache. 
+        Their solutions are not kept as warm-starts, since the 
+        sets were not accepted. Checks that are still running 
+        are kept and recorded on a later call.
+        '''
+        for key, future in list(self.pending.items()):
+            if future.cancel():
+                del self.pending[key]
+            elif future.done():
+                del self.pending[key]
+                relaxed, result, _ = future.result()
+                if relaxed is not None:
+                    self.record(list(key), relaxed)
+                if result is not None:
+                    self.record(list(key), result)
+
+
+    def lookahead(self, candidates, get_set):
+        '''
+        Iterate over candidates, while the vehicle sets of 
+        the next h_workers candidates are already checked in 
+        the worker pool. Results are only consumed via probe() 
+        in the original order, so patience and time limits 
+        behave as in the sequential case. 
+        Remaining checks are flushed when the loop is left.
+
+        Args:
+            candidates (iterable): candidates to be tried
+            get_set (function): vehicle set of a candidate
+        Yields:
+            candidate: next candidate
+        '''
+        candidates = iter(candidates)
+        window = deque()
+        try:
+            while True:
+                while len(window) < self.sk.h_workers:
+                    try:
+                        c = next(candidates)
+                    except StopIteration:
+                        break
+                    window.append(c)
+                    self.submit(get_set(c))
+                if not window:
+                    return
+                yield window.popleft()
+        finally:
+            self.flush()
+
+
+    def close_pool(self):
+        '''
+        Shut down the worker pool without waiting 
+        for running feasibility checks.
+        '''
+        if self.pool is None:
+            return
+        self.flush()
+        # cancel_futures of shutdown() requires python 3.9
+        for future in self.pending.values():
+            future.cancel()
+        self.pool.shutdown(wait=False)
+        self.pool = None
+        self.pending = {}
 
 
     def removals(self, max_time, patience, after_feas_patience=1):
@@ -281,7 +762,8 @@ class greedy2():
             count = 0                      
             after_feas_count = 0           
             ################################
-            for removed in removal_set:
+            for removed in self.lookahead(removal_set, 
+                    lambda r: [i for i in self.v_set if i != r]):
                 # CHECK PATIENCE/TIMELIMIT/IMPROVAL VIOLATIONS #
                 if count >= patience:                          
                     patience_exceeded = True
@@ -297,29 +779,25 @@ class greedy2():
                 # TRY REMOVING IF NOT IN BLACKLIST #
                 tmp_set = self.v_set.copy()
                 tmp_set.remove(removed)
-                name_list = [self.names[i] for i in tmp_set]
-                name_list.sort()
-                if name_list in self.blacklist:
-                    self.stats['blacklist_found'] += 1
+                if self.skip(tmp_set):
                     continue
                 log_str = 'Try removing {}-{} ({})'.format(
                         removed, self.names[removed],
                         self.costs[removed])
                 self.write_log(log_str)
-                grb_mod = self.run_model(tmp_set)
+                feasible, runtime = self.probe(tmp_set)
                 ###################################################
                 # REMEMBER IF FEASIBLE, PROCEED IF INFEASIBLE     #
                 # BREAK IF: 1. FEASIBLE WAS FOUND BEFORE          #
                 #           2. AFTERFEAS-PATIENCE EXCEEDED        #
-                if grb_mod.status == 2:
+                if feasible:
                     tb_removed = removed
                     after_feas_patience = 0
                     self.write_log(('Feasible! ' \
                                     '(Runtime: {:.2f})').format(
-                                    grb_mod.Runtime))
+                                    runtime))
                 else:
                     count += 1
-                    self.blacklist.append(name_list)
                     if not (tb_removed is None):
                         after_feas_count += 1
                         if (after_feas_count 
@@ -328,7 +806,7 @@ class greedy2():
                 ###################################################
             # POSTPROCESS DEPENDING ON REASON OF FOR-LOOP EXIT    #
             if not (tb_removed is None):                            
-                self.v_set.remove(tb_removed)
+                self.v_pool.remove(tb_removed)
                 removal_set.remove(tb_removed)    
                 log_str = 'Removing {}\nNew set: {} ({})'.format(
                 tb_removed,
@@ -367,8 +845,7 @@ class greedy2():
         log_str += '{} ({})'.format(self.v_set, self.sum_costs)
         self.write_log(log_str)
 
-        unused = [i for i in self.full_data.index.tolist() 
-                 if i not in self.v_set]
+        unused = self.v_pool.get_unused()
 
         time_limit_reached = False
         no_options_left = False
@@ -380,41 +857,17 @@ class greedy2():
             no_options_left = True
             for v in v_candidates:
                 v_costs = self.costs[v]
-                unused_red = [item for item in unused 
-                              if self.costs[item]<v_costs]
-                unused_df = self.full_data.iloc[unused]
-                unique_df = unused_df.drop_duplicates(
-                            subset='name')
-                list_1 = [c for c in unique_df.index.tolist() 
-                          if self.costs[c] < v_costs]
-                list_1 = [((c,),[self.costs[c],self.t_eff[c]]) 
-                          for c in list_1]
-                list_2 = [[c1,c2] for c1 in unused for c2 in unused
-                           if self.costs[c1] + self.costs[c2] 
-                              < v_costs]
-                list_2 = remove_duplicates(list_2, self.names)
-                list_2 = [((c1,c2),
-                           [self.costs[c1]+self.costs[c2],
-                            self.t_eff[c1]+self.t_eff[c2]]) 
-                           for [c1,c2] in list_2]
-                list_3 = findTriplets(unused_red, self.costs, 
-                                      v_costs)
-                list_3 = remove_duplicates(list_3, self.names)
-                list_3 = [((c1,c2,c3),
-                           [self.costs[c1]+self.costs[c2]+
-                            self.costs[c3],
-                            self.t_eff[c1]+self.t_eff[c2]+
-                            self.t_eff[c3]]) 
-                          for [c1,c2,c3] in list_3]
-                my_dict = dict(list_1+list_2+list_3)
-                list_sorted = sorted(my_dict.items(), 
-                                     key=lambda item: item[-1][1])
-                list_sorted.reverse()
+                # combinations of unused vehicles, generated lazily
+                list_sorted = swap_candidates(unused, self.names, 
+                                              self.costs, self.t_eff, 
+                                              v_costs)
                 tb_switched = None
                 count = 0
                 after_feas_count = 0
                 found_costs = 1e99
-                for c,[c_costs,c_t_eff] in list_sorted:
+                for c,[c_costs,c_t_eff] in self.lookahead(list_sorted, 
+                        lambda item: [i for i in self.v_set 
+                                      if i not in [v]] + list(item[0])):
                     if not (tb_switched is None): 
                         if c_costs >= found_costs:
                             continue
@@ -427,10 +880,7 @@ class greedy2():
                     tmp_set = self.v_set.copy()
                     tmp_set.remove(v)
                     tmp_set += list(c)
-                    name_list = [self.names[i] for i in tmp_set]
-                    name_list.sort()
-                    if name_list in self.blacklist:
-                        self.stats['blacklist_found'] += 1
+                    if self.skip(tmp_set):
                         continue
                     no_options_left = False
                     log_str = 'Try switching {}-{}'.format(
@@ -440,18 +890,17 @@ class greedy2():
                     log_str += '-> {}-{} ({},{:.1f})'.format(
                                 c, c_names, c_costs, c_t_eff)
                     self.write_log(log_str)
-                    grb_mod = self.run_model(tmp_set)
-                    if grb_mod.status==2:
+                    feasible, runtime = self.probe(tmp_set)
+                    if feasible:
                         found_costs = c_costs
                         tb_switched = [v,c]
                         log_str = 'Feasible! '
                         log_str += '(Runtime: {:.2f})'.format(
-                                    grb_mod.Runtime)
+                                    runtime)
                         self.write_log(log_str)
                         after_feas_count = 0
                     else:
                         count += 1
-                        self.blacklist.append(name_list)
                         if not (tb_switched is None):
                             after_feas_count += 1
                             if (after_feas_count 
@@ -460,11 +909,10 @@ class greedy2():
                 if not (tb_switched is None):
                     set_changed = True
                     [v,c] = tb_switched
-                    self.v_set.remove(v)
-                    self.v_set += list(c)
-                    unused = [item for item in unused 
-                              if item not in list(c)]
-                    unused += [v]
+                    self.v_pool.remove(v)
+                    for i in c:
+                        self.v_pool.add(i)
+                    unused = self.v_pool.get_unused()
                     log_str = 'Switching {} -> {} '.format(v, c)
                     log_str += '\nNew set: {}\n ### {} ###'.format(
                                 tmp_set, self.sum_costs)
@@ -505,8 +953,7 @@ class greedy2():
                 self.v_set, self.sum_costs)
         self.write_log(log_str)
 
-        unused = [i for i in self.full_data.index.tolist() 
-                  if i not in self.v_set]
+        unused = self.v_pool.get_unused()
 
         time_limit_reached = False
         no_options_left = False
@@ -519,40 +966,18 @@ class greedy2():
             no_options_left = True
             for (v1,v2) in v_candidates:
                 v_costs = self.costs[v1] + self.costs[v2]
-                unused_red = [item for item in unused 
-                              if self.costs[item]<v_costs]
                 v_effs = self.t_eff[v1]+self.t_eff[v2]
-                df = self.full_data.iloc[unused]
-                unique_df = df.drop_duplicates(subset='name')
-                list_1 = [c for c in unique_df.index.tolist() 
-                          if self.costs[c] < v_costs]
-                list_1 = [((c,),[self.costs[c],self.t_eff[c]]) 
-                          for c in list_1]
-                list_2 = [[c1,c2] for c1 in unused for c2 in unused
-                         if self.costs[c1] + self.costs[c2] 
-                            < v_costs]
-                list_2 = remove_duplicates(list_2, self.names)
-                list_2 = [((c1,c2),[self.costs[c1]+self.costs[c2],
-                                    self.t_eff[c1]+self.t_eff[c2]])
-                                    for [c1,c2] in list_2]
-                list_3 = findTriplets(unused_red, self.costs, 
-                                      v_costs)
-                list_3 = remove_duplicates(list_3, self.names)
-                list_3 = [((c1,c2,c3),
-                           [self.costs[c1]+self.costs[c2]
-                            +self.costs[c3],
-                            self.t_eff[c1]+self.t_eff[c2]
-                            +self.t_eff[c3]]) 
-                          for [c1,c2,c3] in list_3]
-                my_dict = dict(list_1+list_2+list_3)
-                list_sorted = sorted(my_dict.items(), 
-                                     key=lambda item: item[-1][1])
-                list_sorted.reverse()
+                # combinations of unused vehicles, generated lazily
+                list_sorted = swap_candidates(unused, self.names, 
+                                              self.costs, self.t_eff, 
+                                              v_costs)
                 tb_switched = None
                 count = 0
                 after_feas_count = 0
                 found_costs = 1e99
-                for c,[c_costs,c_t_eff] in list_sorted:
+                for c,[c_costs,c_t_eff] in self.lookahead(list_sorted, 
+                        lambda item: [i for i in self.v_set 
+                                      if i not in [v1,v2]] + list(item[0])):
                     if not (tb_switched is None): 
                         if c_costs >= found_costs:
                             continue
@@ -566,10 +991,7 @@ class greedy2():
                     tmp_set = [item for item in tmp_set 
                                if item not in [v1,v2]]
                     tmp_set += list(c)
-                    name_list = [self.names[i] for i in tmp_set]
-                    name_list.sort()
-                    if name_list in self.blacklist:
-                        self.stats['blacklist_found'] += 1
+                    if self.skip(tmp_set):
                         continue
                     no_options_left = False
                     log_str = 'Try switching {}-{} & {}-{}'.format(
@@ -580,18 +1002,17 @@ class greedy2():
                     log_str += '({},{:.1f})'.format(c_costs, 
                                                     c_t_eff)
                     self.write_log(log_str)
-                    grb_mod = self.run_model(tmp_set)
-                    if grb_mod.status==2:
+                    feasible, runtime = self.probe(tmp_set)
+                    if feasible:
                         found_costs = c_costs
                         tb_switched = [v1,v2,c]
                         log_str = 'Feasible! '
                         log_str += '(Runtime: {:.2f})'.format(
-                                    grb_mod.Runtime)
+                                    runtime)
                         self.write_log(log_str)
                         after_feas_count = 0
                     else:
                         count += 1
-                        self.blacklist.append(name_list)
                         if not (tb_switched is None):
                             after_feas_count += 1
                             if (after_feas_count 
@@ -600,12 +1021,11 @@ class greedy2():
                 if not (tb_switched is None):
                     set_changed = True
                     [v1,v2,c] = tb_switched
-                    self.v_set = [item for item in self.v_set 
-                                  if item not in [v1,v2]]
-                    self.v_set += list(c)
-                    unused = [item for item in unused 
-                              if item not in list(c)]
-                    unused += [v1,v2]
+                    for i in [v1,v2]:
+                        self.v_pool.remove(i)
+                    for i in c:
+                        self.v_pool.add(i)
+                    unused = self.v_pool.get_unused()
                     log_str = 'Switching {} & {} -> {} '.format( 
                                 v1, v2, c)
                     log_str += '\nNew set: {}\n ### {} ###'.format(
@@ -647,8 +1067,7 @@ class greedy2():
         log_str += '{} ({})'.format(self.v_set, self.sum_costs)
         self.write_log(log_str)
 
-        unused = [i for i in self.full_data.index.tolist() 
-                  if i not in self.v_set]
+        unused = self.v_pool.get_unused()
 
         time_limit_reached = False
         no_options_left = False 
@@ -663,42 +1082,19 @@ class greedy2():
             for (v1,v2,v3) in v_candidates:
                 v_costs = (self.costs[v1] + self.costs[v2] 
                           + self.costs[v3])
-                unused_red = [item for item in unused 
-                              if self.costs[item]<v_costs]
                 v_t_effs = (self.t_eff[v1] + self.t_eff[v2] 
                             + self.t_eff[v3])
-                df = self.full_data.iloc[unused]
-                unique_df = df.drop_duplicates(subset='name')
-                list_1 = [c for c in unique_df.index.tolist() 
-                          if self.costs[c] < v_costs]
-                list_1 = [((c,),[self.costs[c],self.t_eff[c]]) 
-                          for c in list_1]
-                list_2 = [[c1,c2] for c1 in unused 
-                                  for c2 in unused 
-                          if (self.costs[c1] + self.costs[c2] 
-                              < v_costs)]
-                list_2 = remove_duplicates(list_2, self.names)
-                list_2 = [((c1,c2),[self.costs[c1]+self.costs[c2],
-                                    self.t_eff[c1]+self.t_eff[c2]])
-                                    for [c1,c2] in list_2]
-                list_3 = findTriplets(unused_red,self.costs,
-                                      v_costs)
-                list_3 = remove_duplicates(list_3, self.names)
-                list_3 = [((c1,c2,c3),
-                          [self.costs[c1]+self.costs[c2]
-                           +self.costs[c3],
-                           self.t_eff[c1]+self.t_eff[c2]
-                           +self.t_eff[c3]]) 
-                           for [c1,c2,c3] in list_3]
-                my_dict = dict(list_1+list_2+list_3)
-                list_sorted = sorted(my_dict.items(), 
-                                     key=lambda item: item[-1][1])
-                list_sorted.reverse()
+                # combinations of unused vehicles, generated lazily
+                list_sorted = swap_candidates(unused, self.names, 
+                                              self.costs, self.t_eff, 
+                                              v_costs)
                 tb_switched = None
                 count = 0
                 after_feas_count = 0
                 found_costs = 1e99
-                for c,[c_costs,c_t_eff] in list_sorted:
+                for c,[c_costs,c_t_eff] in self.lookahead(list_sorted, 
+                        lambda item: [i for i in self.v_set 
+                                      if i not in [v1,v2,v3]] + list(item[0])):
                     if not (tb_switched is None): 
                         if c_costs >= found_costs:
                             continue
@@ -712,10 +1108,7 @@ class greedy2():
                     tmp_set = [item for item in tmp_set 
                                if item not in [v1,v2,v3]]
                     tmp_set += list(c) 
-                    name_list = [self.names[i] for i in tmp_set]
-                    name_list.sort()
-                    if name_list in self.blacklist:
-                        self.stats['blacklist_found'] += 1
+                    if self.skip(tmp_set):
                         continue
                     no_options_left = False
                     log_str = 'Try switching {}-{} & {}-{}'.format(
@@ -727,18 +1120,17 @@ class greedy2():
                     log_str += '-> {}-{} ({},{:.1f})'.format( 
                                 c, c_names, c_costs, c_t_eff)
                     self.write_log(log_str)
-                    grb_mod = self.run_model(tmp_set)
-                    if grb_mod.status==2:
+                    feasible, runtime = self.probe(tmp_set)
+                    if feasible:
                         found_costs = c_costs
                         tb_switched = [v1,v2,v3,c]
                         log_str = 'Feasible! '
                         log_str += '(Runtime: {:.2f})'.format(
-                                    grb_mod.Runtime)
+                                    runtime)
                         self.write_log(log_str)
                         after_feas_count = 0
                     else:
                         count += 1
-                        self.blacklist.append(name_list)
                         if not (tb_switched is None):
                             after_feas_count += 1
                             if (after_feas_count 
@@ -747,12 +1139,11 @@ class greedy2():
                 if not (tb_switched is None):
                     set_changed = True
                     [v1,v2,v3,c] = tb_switched
-                    self.v_set = [item for item in self.v_set 
-                                  if item not in [v1,v2,v3]]
-                    self.v_set += list(c)
-                    unused = [item for item in unused 
-                              if item not in list(c)]
-                    unused += [v1,v2,v3]
+                    for i in [v1,v2,v3]:
+                        self.v_pool.remove(i)
+                    for i in c:
+                        self.v_pool.add(i)
+                    unused = self.v_pool.get_unused()
                     log_str = 'Switching {} & {} & {} '.format(
                                v1, v2, v3) 
                     log_str += '-> {} \nNew set: {}'.format(
@@ -780,9 +1171,21 @@ if __name__ == "__main__":
     parser.add_argument('-c', '--config', 
                         dest='config', default='config.yaml', 
                         help='Config file to be used')
+    parser.add_argument('-o', '--output', 
+                        dest='output', default='output', 
+                        help='Output directory to be used')
+    parser.add_argument('-t', '--threads', type=int, 
+                        dest='threads', default=None, 
+                        help='Gurobi threads, overrides config')
+    parser.add_argument('-w', '--workers', type=int, 
+                        dest='workers', default=None, 
+                        help='Parallel candidate checks, overrides config')
     args = parser.parse_args()
 
-    heuristic = greedy2(args.config)
+    heuristic = greedy2(args.config, out_dir=args.output, 
+                        workers=args.workers)
+    if args.threads is not None:
+        heuristic.sk.threads = args.threads
     heuristic.sk.min_vehicles = False
     heuristic.sk.LogToConsole = False
     heuristic.sk.obj = 0
@@ -833,8 +1236,13 @@ if __name__ == "__main__":
         nol_2 = heuristic.switch_2vX(0.33*time_left,1)
         nol_3 = heuristic.switch_3vX(0.33*time_left,1)
         if (nol_1 or nol_2 or nol_3):
+            # before giving up, spend the time on unknown sets
+            time_left = v_time_limit - (time.time()-start)
+            if heuristic.retry_unknown(time_left):
+                continue
             heuristic.write_log('No more options! Exiting...')
             break
+    heuristic.close_pool()
 
     v_time = time.time() - start
     stats = heuristic.stats
@@ -847,8 +1255,21 @@ if __name__ == "__main__":
                        stats['inf_time'],
                        stats['tlimit']) 
     stats_str += ' -> {:.2f}s'.format(stats['tlimit_time'])
-    stats_str += '\n{} blacklist entries skipped'.format(
+    stats_str += '\n{} retried'.format(stats['retry'])
+    stats_str += ' -> {:.2f}s'.format(stats['retry_time'])
+    stats_str += '\n{} rejected by screening'.format(stats['screened'])
+    if heuristic.sk.h_relax:
+        stats_str += '\n{} relaxations -> {:.2f}s'.format(
+                      stats['relax'], stats['relax_time'])
+        stats_str += ', {} infeasible ({:.1f} % of probes)'.format(
+                      stats['relax_inf'], 100 * stats['relax_inf'] 
+                      / max(1, stats['relax_inf'] + stats['iter']))
+    stats_str += '\n{} known infeasible sets skipped'.format(
                   stats['blacklist_found'])
+    stats_str += '\n{} unresolved sets skipped'.format(
+                  stats['unknown_found'])
+    stats_str += '\n{} known feasible sets accepted'.format(
+                  stats['cache_found'])
 
 
     log_str = '\nFinal set: \n{}'.format(
@@ -887,6 +1308,32 @@ if __name__ == "__main__":
     log_str += stats_str
     log_str += '\nTotal runtime: {:.2f}'.format(time.time()-start)
     heuristic.write_log(log_str)
+
+    # summary for aggregation over multiple runs, see pypeline.py
+    results = {'instance': heuristic.sk.instance_str,
+               'vehicles': len(heuristic.v_set),
+               'vehicle_costs': float(
+                    heuristic.sk.vehicle_data['costs'].sum()),
+               'obj': float(grb_mod.objVal),
+               'combined_obj': float(grb_mod.objVal 
+                    + heuristic.sk.vehicle_data['costs'].sum()),
+               'gap': float(grb_mod.MIPGap),
+               'v_set_runtime': v_time,
+               'runtime': time.time()-start,
+               'iter': stats['iter'],
+               'feas': stats['feas'],
+               'inf': stats['inf'],
+               'tlimit': stats['tlimit'],
+               'tlimit_time': stats['tlimit_time'],
+               'retry': stats['retry'],
+               'retry_time': stats['retry_time'],
+               'screened': stats['screened'],
+               'relax': stats['relax'],
+               'relax_inf': stats['relax_inf']}
+    res_path = os.path.join(heuristic.sk.out_dir, 
+                            heuristic.sk.instance_str + '_results.yaml')
+    with open(res_path, 'w') as res_file:
+        yaml.dump(results, res_file)
         
     heuristic.profiler.disable()
     s = io.StringIO()
@@ -894,7 +1341,7 @@ if __name__ == "__main__":
     ps = stats.sort_stats(SortKey.CUMULATIVE)
     ps.print_stats(20)
     #print(s.getvalue())
-    proFile = os.path.join('output', 
+    proFile = os.path.join(heuristic.sk.out_dir, 
                            heuristic.sk.time_str + '_profile.txt')
     
 
@@ -4,6 +4,7 @@ import PySimpleGUI as sg
 import matplotlib
 import os
 from visualizers import visuals
+from utils import get_result_file
 import pickle
 import argparse
 
@@ -87,8 +88,8 @@ class my_gui():
         with open(filename,'rb') as pickle_file:
             model_dict = pickle.load(pickle_file)
             
-        txt_path = os.path.splitext(filename)[0] + '.txt'
-        self.visuals = visuals(model_dict, txt_path)
+        res_path = get_result_file(os.path.splitext(filename)[0])
+        self.visuals = visuals(model_dict, res_path)
         self.visuals.show_fictive_soc = False
         self.visuals.show_producers = True
         self.visuals.label_vehicles = False
@@ -8,10 +8,31 @@ import yaml
 import time
 
 from utils import *
-from smart_krit import my_sk
+from smart_krit import my_sk, FEASIBLE, INFEASIBLE
 import argparse
 
 
+def probe(sk, logger):
+    '''
+    Probe the feasibility of a model. If sk.h_relax is set, 
+    it is screened by its LP relaxation first (see 
+    my_sk.check_relaxation()) and the MIP is only 
+    solved if the relaxation is feasible.
+
+    Returns:
+        result (probe_result): see my_sk.check_feasibility()
+    '''
+    if sk.h_relax:
+        result = sk.check_relaxation()
+        logger.info(f'Relaxation {result.status} after {result.runtime} s')
+        if result.status == INFEASIBLE:
+            return result
+    result = sk.check_feasibility()
+    logger.info(f'{result.status} after {result.runtime} s')
+
+    return result
+
+
 def main(configs, time_limit_total, time_limit_b, out_dir, approach, time_windows):
     '''
     Part B: (A is direct solution of full model)
@@ -66,30 +87,22 @@ def main(configs, time_limit_total, time_limit_b, out_dir, approach, time_window
                     yaml_dict['constrain_vehicles'] = v_limit
                     sk = my_sk(yaml_dict, out_dir=tmp_out)
                     sk.preprocess()
-                    grb_mod = sk.solve()
+                    result = probe(sk, logger)
 
                     # Check feasibility
-                    if grb_mod.status == 2:
-                        sk.postprocess(grb_mod)
+                    if result.status == FEASIBLE:
+                        sk.postprocess(sk.mod)
                         best_limit = v_limit
-                        best_res = os.path.join(tmp_out, (sk.instance_str + '.txt'))
-                        logger.info(f'Feasible after {grb_mod.runtime} s')
-                        status = 'FEASIBLE'
-                    elif grb_mod.status == 3:
-                        logger.info(f'Infeasible after {grb_mod.runtime} s')
-                        status = 'INFEASIBLE'
-                    elif grb_mod.status == 9:
-                        logger.info(f'Timeout after {grb_mod.runtime} s')
-                        status = 'TIMEOUT'
-                    else:
-                        logger.info(f'grb_mod status returned: {grb_mod.status}')
-                        status = grb_mod.status
+                        best_res = os.path.join(tmp_out, (sk.instance_str + '.npz'))
                     res_frame = res_frame.append({'config': config_name,
                                                   't': t,
                                                   'v_limit': v_limit,
-                                                  'status': status,
-                                                  'runtime': grb_mod.runtime}, ignore_index=True)
+                                                  'status': result.status,
+                                                  'runtime': result.runtime}, ignore_index=True)
                     res_frame.to_csv(os.path.join(out_dir, 'tmp_results.csv'))
+                    if result.relaxed:
+                        # lower vehicle limits are infeasible as well
+                        break
             elif approach == 'pb':
                 ub = yaml_dict['v_max']
                 lb = 0
@@ -99,32 +112,21 @@ def main(configs, time_limit_total, time_limit_b, out_dir, approach, time_window
                     yaml_dict['constrain_vehicles'] = v_limit
                     sk = my_sk(yaml_dict, out_dir=tmp_out)
                     sk.preprocess()
-                    grb_mod = sk.solve()
+                    result = probe(sk, logger)
 
                     # Check feasibility
-                    if grb_mod.status == 2:
-                        sk.postprocess(grb_mod)
+                    if result.status == FEASIBLE:
+                        sk.postprocess(sk.mod)
                         best_limit = v_limit
-                        best_res = os.path.join(tmp_out, (sk.instance_str + '.txt'))
-                        logger.info(f'Feasible after {grb_mod.runtime} s')
+                        best_res = os.path.join(tmp_out, (sk.instance_str + '.npz'))
                         ub = v_limit
-                        status = 'FEASIBLE'
                     else:
                         lb = v_limit
-                        if grb_mod.status == 3:
-                            logger.info(f'Infeasible  after {grb_mod.runtime} s')
-                            status = 'INFEASIBLE'
-                        elif grb_mod.status == 9:
-                            logger.info(f'Timeout after {grb_mod.runtime} s')
-                            status = 'TIMEOUT'
-                        else:
-                            logger.info(f'grb_mod status returned: {grb_mod.status}')
-                            status = grb_mod.status
                     res_frame = res_frame.append({'config': config_name,
                                                   't': t,
                                                   'v_limit': v_limit,
-                                                  'status': status,
-                                                  'runtime': grb_mod.runtime}, ignore_index=True)
+                                                  'status': result.status,
+                                                  'runtime': result.runtime}, ignore_index=True)
                     v_limit = int(lb+(ub-lb)/2)
                     res_frame.to_csv(os.path.join(out_dir, 'tmp_results.csv'))
 
@@ -148,31 +150,20 @@ def main(configs, time_limit_total, time_limit_b, out_dir, approach, time_window
                     # re run
                     sk = my_sk(yaml_dict, out_dir=tmp_out)
                     sk.preprocess()
-                    grb_mod = sk.solve()
+                    result = probe(sk, logger)
 
-                    if grb_mod.status == 2:
-                        sk.postprocess(grb_mod)
+                    if result.status == FEASIBLE:
+                        sk.postprocess(sk.mod)
                         best_limit = yaml_dict['v_max']
-                        best_res = os.path.join(tmp_out, (sk.instance_str + '.txt'))
-                        logger.info(f'Feasible after {grb_mod.runtime} s')
-                        status = 'FEASIBLE'
+                        best_res = os.path.join(tmp_out, (sk.instance_str + '.npz'))
                     else:
                         # still no solution -> exit
                         while_flag = False
-                        if grb_mod.status == 3:
-                            logger.info(f'Infeasible  after {grb_mod.runtime} s')
-                            status = 'INFEASIBLE'
-                        elif grb_mod.status == 9:
-                            logger.info(f'Timeout after {grb_mod.runtime} s')
-                            status = 'TIMEOUT'
-                        else:
-                            logger.info(f'grb_mod status returned: {grb_mod.status}')
-                            status = grb_mod.status
                     res_frame = res_frame.append({'config': config_name,
                                                   't': t,
                                                   'v_limit': yaml_dict['v_max'],
-                                                  'status': status,
-                                                  'runtime': grb_mod.runtime}, ignore_index=True)
+                                                  'status': result.status,
+                                                  'runtime': result.runtime}, ignore_index=True)
                     res_frame.to_csv(os.path.join(out_dir, 'tmp_results.csv'))
                 else:
                     # this part only once
@@ -3,26 +3,176 @@
 import os
 import glob
 import subprocess
-from sys import platform 
+import argparse
+import yaml
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from sys import executable
 
 
-#print(platform)
+def find_configs(patterns):
+    '''
+    Collect config files matching the given glob-patterns
+    or lying in the given directories (recursively).
 
-if platform in ['linux','linux2']:
-    configs = glob.glob(os.path.join('configs', '*.YAML')) +  glob.glob(os.path.join('configs', '*.yaml'))
-elif platform == 'win32':
-    configs = glob.glob(os.path.join('configs', '*.YAML'))
-else:
-    print('Unknown platform!')
-    exit()
+    Args:
+        patterns (list): glob-patterns, files or directories
+    Returns:
+        configs (list): sorted paths of unique config files
+    '''
+    configs = {}
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '**', '*')
+        for config in glob.glob(pattern, recursive=True):
+            if os.path.splitext(config)[1].lower() == '.yaml':
+                # *.yaml and *.YAML match the same files on windows
+                configs[os.path.normcase(os.path.abspath(config))] = config
 
-#print(configs)
+    return sorted(configs.values())
 
-for i, config in enumerate(configs):
-    print('\n{} of {}: {}'.format(i+1,len(configs),config))
-    #proc = subprocess.Popen('python greedy2.py -c {}'.format(config), stdout=subprocess.PIPE, shell=True)
-    #(out, err) = proc.communicate()
-    #print "program output:", out
 
-    #os.system('python smart_krit.py -c {}'.format(config))
-    os.system('python greedy2.py -c {}'.format(config))
+def get_job_dirs(configs, out_dir):
+    '''
+    Assign an output directory to each config, mirroring the
+    directory structure of the configs below their common root,
+    e.g. configs/solomon/c1/c101.yaml -> out_dir/solomon/c1/c101.
+    Hence, runs do not depend on time_str to be distinguished.
+
+    Args:
+        configs (list): paths of config files
+        out_dir (str): root of all output directories
+    Returns:
+        job_dirs (list): output directory of each config
+    '''
+    dirs = [os.path.dirname(os.path.abspath(c)) for c in configs]
+    root = os.path.commonpath(dirs)
+    job_dirs = []
+    for config in configs:
+        rel_path = os.path.relpath(os.path.abspath(config), root)
+        job_dirs.append(os.path.join(out_dir,
+                                     os.path.splitext(rel_path)[0]))
+
+    return job_dirs
+
+
+def get_results(job_dir):
+    '''
+    Return the results-file written by greedy2 in job_dir,
+    None if the job has not been finished yet.
+    '''
+    res_files = sorted(glob.glob(os.path.join(job_dir,
+                                              '*_results.yaml')))
+    if len(res_files) == 0:
+        return None
+
+    return res_files[-1]
+
+
+def run_job(config, job_dir, threads, workers):
+    '''
+    Run greedy2 for a single config, unless results exist
+    already (e.g. when resuming a crashed batch).
+    Console output is written to job_dir/console.txt.
+
+    Args:
+        config (str): path to YAML
+        job_dir (str): output directory of this job
+        threads (int): gurobi threads of each worker
+        workers (int): parallel candidate checks of this job
+    Returns:
+        status (str): 'skipped', 'finished' or 'failed'
+    '''
+    if get_results(job_dir) is not None:
+        return 'skipped'
+    if not os.path.exists(job_dir):
+        os.makedirs(job_dir)
+    cmd = [executable, 'greedy2.py', '-c', config,
+           '-o', job_dir, '-t', str(threads), '-w', str(workers)]
+    with open(os.path.join(job_dir, 'console.txt'), 'a') as console:
+        proc = subprocess.run(cmd, stdout=console,
+                              stderr=subprocess.STDOUT)
+    if proc.returncode != 0 or get_results(job_dir) is None:
+        return 'failed'
+
+    return 'finished'
+
+
+def collect_results(configs, job_dirs, out_dir):
+    '''
+    Aggregate the results of all jobs into out_dir/results.csv
+
+    Returns:
+        res_frame (pd.DataFrame): one row per config
+    '''
+    rows = []
+    for config, job_dir in zip(configs, job_dirs):
+        row = {'config': config}
+        res_file = get_results(job_dir)
+        if res_file is None:
+            row['status'] = 'MISSING'
+        else:
+            with open(res_file) as f:
+                row.update(yaml.load(f, Loader=yaml.FullLoader))
+            row['status'] = 'FINISHED'
+        rows.append(row)
+    res_frame = pd.DataFrame(rows)
+    res_frame.to_csv(os.path.join(out_dir, 'results.csv'), index=False)
+
+    return res_frame
+
+
+def main(patterns, out_dir, cpus, threads, workers):
+    '''
+    Run greedy2 for all configs matching *patterns*.
+    The CPU budget *cpus* is divided into cpus//(threads*workers)
+    parallel jobs with *workers* parallel candidate checks 
+    (overriding h_workers of the configs) of *threads* 
+    gurobi threads each.
+    '''
+    configs = find_configs(patterns)
+    if len(configs) == 0:
+        print('No configs found!')
+        exit()
+    job_dirs = get_job_dirs(configs, out_dir)
+    n_jobs = max(1, cpus // (threads * workers))
+    print('{} configs, {} parallel jobs with {} workers of {} threads '
+          'each'.format(len(configs), n_jobs, workers, threads))
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        futures = [pool.submit(run_job, config, job_dir, threads, 
+                               workers)
+                   for config, job_dir in zip(configs, job_dirs)]
+        for i, (config, future) in enumerate(zip(configs, futures)):
+            print('{} of {}: {} -> {}'.format(i+1, len(configs),
+                                              config, future.result()))
+
+    res_frame = collect_results(configs, job_dirs, out_dir)
+    print(res_frame)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+             description='Run greedy2 on multiple configs in parallel.')
+    parser.add_argument('-c', '--configs', nargs='+',
+                        dest='configs',
+                        default=[os.path.join('configs', '*.yaml'),
+                                 os.path.join('configs', '*.YAML')],
+                        help='Config files, directories or glob-patterns')
+    parser.add_argument('-o', '--output',
+                        dest='output', default=os.path.join('output',
+                                                            'batch'),
+                        help='Output directory to be used')
+    parser.add_argument('-n', '--cpus', type=int,
+                        dest='cpus', default=os.cpu_count(),
+                        help='Total number of CPUs to be used')
+    parser.add_argument('-t', '--threads', type=int,
+                        dest='threads', default=1,
+                        help='Gurobi threads per worker')
+    parser.add_argument('-w', '--workers', type=int,
+                        dest='workers', default=1,
+                        help='Parallel candidate checks per job')
+    args = parser.parse_args()
+
+    main(args.configs, args.output, args.cpus, args.threads, 
+         args.workers)
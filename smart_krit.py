@@ -5,6 +5,88 @@ import os
 import yaml     # !conda install pyyaml!
 import pickle
 import argparse
+from collections import namedtuple
+
+
+def lin_expr(variables, indices, coeffs=None):
+    '''
+    Build a linear expression over a subset of variables.
+
+    Args:
+        variables (list): gurobi variables
+        indices (list): positions of the variables to be included
+        coeffs (list): coefficients of all variables (default: 1.0)
+    Returns:
+        expr (GRB.LinExpr): (weighted) sum of the chosen variables
+    '''
+    if coeffs is None:
+        return LinExpr([1.0] * len(indices), 
+                       [variables[i] for i in indices])
+    return LinExpr([coeffs[i] for i in indices], 
+                   [variables[i] for i in indices])
+
+
+def set_start(mod, variables, start):
+    '''
+    Apply warm-start values to a family of variables 
+    via a single setAttr-call.
+    Indices missing in *start* are left undefined, unless 
+    *start* is a defaultdict, which provides its default.
+
+    Args:
+        mod (GRB.Model): gurobi-model
+        variables (tupledict): variables of one family
+        start (dict): warm-start values by index
+    Returns:
+        warm_starts (int): number of variables with a start value
+    '''
+    if start is None or variables is None:
+        return 0
+    if getattr(start, 'default_factory', None) is not None:
+        default = start.default_factory()
+        grb_vars = list(variables.values())
+        values = [start.get(ind, default) for ind in variables.keys()]
+    else:
+        grb_vars = []
+        values = []
+        for ind, var in variables.items():
+            if ind in start:
+                grb_vars.append(var)
+                values.append(start[ind])
+    if len(grb_vars) > 0:
+        mod.setAttr('Start', grb_vars, values)
+
+    return len(grb_vars)
+
+
+# outcome of a feasibility probe, see my_sk.check_feasibility()
+FEASIBLE = 'FEASIBLE'
+INFEASIBLE = 'INFEASIBLE'
+UNKNOWN = 'UNKNOWN'
+# relaxed: result of the LP infeasibility screen only, 
+# see my_sk.check_relaxation()
+probe_result = namedtuple('probe_result', 
+                          ['status', 'runtime', 'relaxed'], 
+                          defaults=[False])
+
+
+def get_probe_status(grb_status):
+    '''
+    Map a gurobi status to the outcome of a feasibility probe.
+    Probes stop at the first incumbent (SOLUTION_LIMIT), 
+    any status without a proof either way (e.g. TIME_LIMIT) 
+    is UNKNOWN.
+
+    Args:
+        grb_status (int): status of the gurobi-model
+    Returns:
+        status (str): FEASIBLE, INFEASIBLE or UNKNOWN
+    '''
+    if grb_status in (GRB.OPTIMAL, GRB.SOLUTION_LIMIT):
+        return FEASIBLE
+    if grb_status in (GRB.INFEASIBLE, GRB.INF_OR_UNBD):
+        return INFEASIBLE
+    return UNKNOWN
 
 
 class my_sk():
@@ -66,19 +148,24 @@ class my_sk():
         self.MIPFocus = yaml_dict['MIPFocus']
         self.MIPGap = yaml_dict['MIPGap']
         self.CutPasses = yaml_dict['CutPasses']
+        self.feas_tol = 1e-3
         self.write_lp = yaml_dict['write_lp']
+        self.compress_solution = yaml_dict.get('compress_solution', True)
         self.LogToConsole = yaml_dict['LogToConsole']
         self.TimeLimit = yaml_dict['TimeLimit']
 
         # heuristic settings
         self.h_init_time_limit = yaml_dict['h_init_time_limit']
         self.h_time_limit = yaml_dict['h_time_limit']
+        self.h_retry_factor = yaml_dict.get('h_retry_factor', 2)
         self.h_init = yaml_dict['h_init']
+        self.h_persistent = yaml_dict.get('h_persistent', True)
+        self.h_workers = yaml_dict.get('h_workers', 1)
+        self.h_relax = yaml_dict.get('h_relax', False)
 
-        # read data
-        self.get_node_data()
-        self.init_nodes()
-        self.vehicle_data = get_vehicle_data(yaml_dict)
+        # read data, from a compiled instance if available
+        self.cache_dir = yaml_dict.get('cache_dir', None)
+        self.load_instance(yaml_dict)
         self.vehicles = range(self.vehicle_data.shape[0])
 
         if self.constrain_vehicles is None:
@@ -99,6 +186,41 @@ class my_sk():
                                     self.instance_str + '_log.txt')
 
         self.mod = Model("smart_krit")
+        self.grb_vars = None
+        self.active_vehicles = None
+
+
+    def load_instance(self, yaml_dict):
+        '''
+        Initialize node- and vehicle-data. 
+        If cache_dir is set, the parsed data, distances and 
+        profiles are taken from a compiled instance, which is 
+        created on first use and identified via the 
+        config and the contents of all input files.
+
+        Args:
+            yaml_dict (dict): Dictionary containing information 
+                            from config-file 
+        '''
+        instance = None
+        if self.cache_dir:
+            key = get_instance_key(yaml_dict)
+            instance = read_instance(self.cache_dir, key)
+        if instance is None:
+            self.get_node_data()
+            self.init_nodes()
+            self.vehicle_data = get_vehicle_data(yaml_dict)
+            if self.cache_dir:
+                write_instance(self.cache_dir, key, 
+                               {'node_data': self.node_data, 
+                                'dist': self.dist, 
+                                'E_nt': self.E_nt, 
+                                'vehicle_data': self.vehicle_data}, 
+                               [self.profiles[n] for n in self.N_pc])
+        else:
+            self.node_data = instance['node_data']
+            self.init_nodes(instance['dist'], instance['E_nt'])
+            self.vehicle_data = instance['vehicle_data']
 
 
     def get_node_data(self):
@@ -142,11 +264,15 @@ class my_sk():
                             ignore_index=True)        
 
 
-    def init_nodes(self):
+    def init_nodes(self, dist=None, E_nt=None):
         '''
         Initialize node-related data.
         - read available node_data
         - creates model-specific lists and sets for further use.
+
+        Args (optional):
+            dist (np.array): precomputed distances between nodes
+            E_nt (np.array): precomputed profiles of nodes
         '''
         node_data = self.node_data
         depots = node_data.index[node_data['type'] == 'D']
@@ -159,7 +285,9 @@ class my_sk():
         others = node_data.index[node_data['type'] == 'O']
         self.others = others.tolist()
         self.nodes = range(node_data.shape[0])
-        self.dist = get_distance(node_data, 'air')
+        if dist is None:
+            dist = get_distance(node_data, 'air')
+        self.dist = dist
         self.n_names = node_data['ID'].values   
         self.n_type = node_data['type'].values  
         self.n_x = node_data['lon'].values      
@@ -177,9 +305,11 @@ class my_sk():
         self.n_charge = node_data['n_charge'].values            
         self.n_peak = node_data['peak[kW]'].values              
         self.P_n = node_data['power_cdc[kW]'].values
-        self.E_nt = get_profiles(self.N_pc, self.n_peak, 
-                                 self.profiles, self.t_0, 
-                                 self.delta_t, self.t_steps)
+        if E_nt is None:
+            E_nt = get_profiles(self.N_pc, self.n_peak, 
+                                self.profiles, self.t_0, 
+                                self.delta_t, self.t_steps)
+        self.E_nt = E_nt
 
 
     def preprocess(self):
@@ -207,39 +337,56 @@ class my_sk():
             logfile.write(log_str) 
 
         # vehicles
+        self.vehicles = range(self.vehicle_data.shape[0])
         self.S_v_max = self.vehicle_data['cap[kWh]'].values 
-        if self.vehicle_init in ['None', None]:
-            self.s_v0 = self.vehicle_data['cap_0[kWh]'].values
-        else:
-            self.s_v0 = (self.vehicle_init * 
-                         self.vehicle_data['cap[kWh]'].values)
+        self.s_v0 = self.get_s_v0(self.vehicle_data)
         rental_costs = self.vehicle_data['costs'].values
-        P_v = self.vehicle_data['power_cdc[kW]'].values
-        v_cons = self.vehicle_data['consumption[kWh/km]'].values            
-        self.v_speed = self.vehicle_data['speed[km/h]'].values       
+        P_v = self.vehicle_data['power_cdc[kW]'].values.astype(float)
+        v_cons = self.vehicle_data['consumption[kWh/km]'].values.astype(
+                    float)
+        self.v_speed = self.vehicle_data['speed[km/h]'].values.astype(
+                    float)
         self.v_names = self.vehicle_data['name'].values
 
+        # boolean masks over all nodes
+        n_nodes = len(self.nodes)
+        self.is_depot = np.zeros(n_nodes, dtype=bool)
+        self.is_depot[self.depots] = True
+        self.is_consumer = np.zeros(n_nodes, dtype=bool)
+        self.is_consumer[self.consumers] = True
+
         # sets for better readability
         sets = {}
-        sets['vnmt'] = [(v, n, m, t) for v in self.vehicles 
-                        for t in self.times for n in self.nodes 
-                        for m in self.nodes]
-        sets['w'] = [(v, n, m, t) for v in self.vehicles 
-                     for t in self.times for n in self.nodes 
-                     for m in self.nodes 
-                     if self.dist[n,m]/self.v_speed[v] <= 
-                     self.delta_t and not 
-                     (t==self.times[0] and not n in self.depots)        
-                     and not 
-                     (t==self.times[-2] and not m in self.depots)       
-                     and not 
-                     (t==self.times[-1])
-                    ]
-        if self.LogToConsole:
-            print('# w-variables used: {}/{}'.format(
-                  len(sets['w']), len(sets['vnmt'])))
+        # arcs that can be travelled within one time step (v, n, m)
+        reachable = (self.dist[np.newaxis, :, :] 
+                     / self.v_speed[:, np.newaxis, np.newaxis] 
+                     <= self.delta_t)
+        # steps needed to get from a depot to each node (h_from) 
+        # and back to a depot (h_to), per class of vehicle speed
+        n_steps = self.t_steps - 1
+        h_from = np.zeros((len(self.vehicles), n_nodes))
+        h_to = np.zeros((len(self.vehicles), n_nodes))
+        for v_speed in np.unique(self.v_speed):
+            same_speed = self.v_speed == v_speed
+            arcs = reachable[np.argmax(same_speed)]
+            h_from[same_speed] = get_hops(arcs, self.is_depot, n_steps)
+            h_to[same_speed] = get_hops(arcs.T, self.is_depot, n_steps)
+        # arcs of step t start at nodes reachable until t and end at 
+        # nodes from which a depot is reachable until times[-1], 
+        # i.e. vehicles leave from and return to depots
+        sets['w'] = []
+        for v in self.vehicles:
+            for t in self.times[:-1]:
+                arcs = (reachable[v] 
+                        & (h_from[v, :, np.newaxis] <= t) 
+                        & (h_to[v, np.newaxis, :] <= n_steps-1-t))
+                n_ind, m_ind = np.nonzero(arcs)
+                sets['w'] += [(v, n, m, t) for n, m in 
+                              zip(n_ind.tolist(), m_ind.tolist())]
+        # (dis-)charging requires staying at n, i.e. arc (v,n,n,t)
         sets['f'] = [(v, n, t) for v in self.vehicles 
-                     for n in self.N_pc for t in self.times[1:-2]]
+                     for n in self.N_pc for t in self.times[1:-2] 
+                     if h_from[v, n] <= t and h_to[v, n] <= n_steps-1-t]
         sets['f_nt'] = [(n, t) for n in self.N_pc 
                         for t in self.times[1:-2]]
         sets['f_vt'] = [(v, t) for v in self.vehicles 
@@ -251,81 +398,149 @@ class my_sk():
         sets['e_nt'] = [(n, t) for n in self.producers 
                         for t in self.times]
 
-        self.U_vnm = {}
-        self.P_vn = {}
-        self.P_vn_signed = {}
-        self.lambda_v = {}
-        self.depot_dict_0 = {} # vnmt starting from depot n -> 1
-        self.depot_dict_N = {} # vnmt ending in depot m -> 1
-        self.w_neq = {}        # vnmt with n not equal m
-        
-        for t in self.times:
-            for n in self.N_pc:
-                for v in self.vehicles:
-                    self.P_vn[v,n,t] = np.min([P_v[v], 
-                                       self.P_n[n]]) * self.delta_t
-                    if n in self.consumers:
-                        self.P_vn_signed[v,n,t] = -self.P_vn[v,n,t]
-                    else:
-                        self.P_vn_signed[v,n,t] = self.P_vn[v,n,t]
-            for v in self.vehicles:
-                for n in self.nodes:
-                    for m in self.nodes:
-                        if n == m:
-                            self.w_neq[v,n,m,t] = 0.0
-                        else: 
-                            self.w_neq[v,n,m,t] = 1.0
-                        self.U_vnm[v,n,m,t] = float('{:.2f}'.format
-                                     (self.dist[n][m] * v_cons[v]))
-                        if n in self.depots:
-                            self.depot_dict_0[v,n,m,t] = 1.0
-                        else:
-                            self.depot_dict_0[v,n,m,t] = 0.0
-                        if m in self.depots:
-                            self.depot_dict_N[v,n,m,t] = 1.0
-                        else:
-                            self.depot_dict_N[v,n,m,t] = 0.0
-        for v in self.vehicles:
-            self.lambda_v[v] = rental_costs[v]
+        # Parameters do not depend on t and are therefore stored as 
+        # arrays over vehicles and nodes; the time index is dropped 
+        # when reading coefficients in solve().
+        # P_vn[v,n]: energy (dis-)charged by v at n during one step
+        self.P_vn = np.zeros((len(self.vehicles), n_nodes))
+        P_n = np.asarray(self.P_n[self.N_pc], dtype=float)
+        self.P_vn[:, self.N_pc] = (np.minimum(P_v[:, np.newaxis], 
+                                              P_n[np.newaxis, :]) 
+                                   * self.delta_t)
+        self.P_vn_signed = np.where(self.is_consumer[np.newaxis, :], 
+                                    -self.P_vn, self.P_vn)
+        # U_vnm[v,n,m]: energy consumed by v when moving from n to m
+        self.U_vnm = np.round(self.dist[np.newaxis, :, :] 
+                              * v_cons[:, np.newaxis, np.newaxis], 2)
+        self.lambda_v = rental_costs.astype(float)
+
+        # stay[v,n,t]: v can stay at n during step t
+        steps = np.arange(n_steps)
+        stay = ((h_from[:, :, np.newaxis] <= steps) 
+                & (h_to[:, :, np.newaxis] <= n_steps-1-steps))
+        n_w, n_f = len(sets['w']), len(sets['f'])
+        self.tighten_bounds(sets, stay)
+        if self.LogToConsole:
+            print('# w-variables used: {}/{}'.format(
+                  len(sets['w']), 
+                  len(self.vehicles) * n_nodes**2 * self.t_steps))
+            print('# eliminated by soc bounds: {} w, {} f'.format(
+                  n_w - len(sets['w']), n_f - len(sets['f'])))
 
         self.sets = sets
+        # model has to be built again with the new data
+        self.grb_vars = None
 
 
-    def solve(self, f_start=None, w_start=None, s_n_start=None, s_v_start=None,
-              z_start=None, e_start=None, f_fix=None):
+    def tighten_bounds(self, sets, stay):
         '''
-        Solve the model with Gurobi.
+        Propagate bounds on the soc forward in time, loosened by 
+        the feasibility tolerance in each step:
+        - producers: at most the produced energy is added
+        - vehicles: at most the energy available at a reachable 
+          producer or P_vn is charged
+        - consumers: at most the energy of the vehicles able to 
+          reach them is discharged (by the n_charge strongest 
+          ones if limit_vehicles is set), at least E_nt is consumed
+        Moving arcs consuming more than the upper bound of the vehicle 
+        are removed from sets['w'], (dis-)charging without energy 
+        available from sets['f'].
+        Bounds are stored in s_v_ub, s_n_lb and s_n_ub (by time).
 
-        Args (optional):
-            f_start (dict): values to use as warm-start for f_vnt
-            w_start (dict): values to use as warm-start for w_vnmt
-            s_n_start (dict): values to use as warm-start for s_nt
-            s_v_start (dict): values to use as warm-start for s_vt
-            f_fix (dict): values to be fixed for f_vnt 
+        Args:
+            sets (dict): index sets of preprocess(), edited in place
+            stay (np.array): boolean (V, N, T-1) array, True if
+                             v can stay at n during step t
+        '''
+        tol = self.feas_tol
+        n_steps = self.t_steps - 1
+        E_nt = self.E_nt
+        P = self.producers
+        C = self.consumers
+        S_n_max = np.nan_to_num(self.S_n_max.astype(float))
+        s_n0 = np.nan_to_num(self.s_n0.astype(float))
+        # (dis-)charging is modelled for steps 1..n_steps-2 only
+        can_f = stay.copy()
+        can_f[:, :, [0, -1]] = False
 
-        Returns:
-            mod (GRB.Model object): solved gurobi-model
+        s_n_lb = np.zeros((len(self.nodes), self.t_steps))
+        s_n_ub = np.zeros((len(self.nodes), self.t_steps))
+        s_n_lb[:, 0] = s_n_ub[:, 0] = s_n0
+        for t in range(n_steps):
+            s_n_ub[P, t+1] = np.minimum(S_n_max[P], s_n_ub[P, t] 
+                                        + E_nt[P, t] + tol)
+        # energy available at producers during each step
+        available = s_n_ub[P, :n_steps] + E_nt[P, :n_steps]
+        gain = np.where(can_f[:, P, :], 
+                        np.minimum(self.P_vn[:, P, np.newaxis], 
+                                   available[np.newaxis, :, :]), 
+                        0).max(axis=1, initial=0)
+        s_v_ub = np.zeros((len(self.vehicles), self.t_steps))
+        s_v_ub[:, 0] = self.s_v0
+        for t in range(n_steps):
+            s_v_ub[:, t+1] = np.minimum(self.S_v_max, s_v_ub[:, t] 
+                                        + gain[:, t] + tol)
+        n_charge = self.n_charge[C].astype(float)
+        ranks = np.arange(len(self.vehicles))[:, np.newaxis]
+        for t in range(n_steps):
+            cap = np.where(can_f[:, C, t], 
+                           np.minimum(self.P_vn[:, C], 
+                                      s_v_ub[:, t, np.newaxis]), 
+                           0)
+            if self.limit_vehicles:
+                # fractional share of the vehicles ranked by power
+                cap = (-np.sort(-cap, axis=0) 
+                       * np.clip(n_charge - ranks, 0, 1))
+            s_n_ub[C, t+1] = np.minimum(S_n_max[C], s_n_ub[C, t] 
+                                        - E_nt[C, t] 
+                                        + cap.sum(axis=0) + tol)
+            s_n_lb[C, t+1] = np.maximum(0, s_n_lb[C, t] 
+                                        - E_nt[C, t] - tol)
+
+        w_ind = np.array(sets['w'], dtype=int).reshape(-1, 4)
+        keep = ((w_ind[:, 1] == w_ind[:, 2]) 
+                | (self.U_vnm[w_ind[:, 0], w_ind[:, 1], w_ind[:, 2]] 
+                   <= s_v_ub[w_ind[:, 0], w_ind[:, 3]] + tol))
+        sets['w'] = [tuple(ind) for ind in w_ind[keep].tolist()]
+        f_ind = np.array(sets['f'], dtype=int).reshape(-1, 3)
+        energy = np.where(self.is_consumer[f_ind[:, 1]], 
+                          s_v_ub[f_ind[:, 0], f_ind[:, 2]], 
+                          s_n_ub[f_ind[:, 1], f_ind[:, 2]] 
+                          + E_nt[f_ind[:, 1], f_ind[:, 2]])
+        sets['f'] = [tuple(ind) for ind in f_ind[energy > tol].tolist()]
+
+        self.s_v_ub = s_v_ub
+        self.s_n_lb = s_n_lb
+        self.s_n_ub = s_n_ub
+
+
+    def get_s_v0(self, vehicle_data):
+        '''
+        Return the initial soc of vehicles (in kWh), 
+        either from the data or relative to their capacity.
+        '''
+        if self.vehicle_init in ['None', None]:
+            return vehicle_data['cap_0[kWh]'].values
+
+        return self.vehicle_init * vehicle_data['cap[kWh]'].values
+
+
+    def build_model(self, f_fix=None):
+        '''
+        Add all variables and constraints to the gurobi model.
+        Any previous content of the model is removed.
+        Variables and coefficients are stored in self.grb_vars,
+        so that the model can be reused by subsequent calls of solve().
+
+        Args (optional):
+            f_fix (dict): values to be fixed for f_vnt,
+                          consumer updates are omitted in that case
         '''
         sets = self.sets
         mod = self.mod
         mod.remove(mod.getVars())
         mod.remove(mod.getConstrs())
 
-        self.mod.Params.LogFile = self.LogFile
-        mod.Params.LogToConsole = self.LogToConsole
-        mod.Params.threads = self.threads
-        mod.Params.method = self.method
-        mod.Params.MIPFocus = self.MIPFocus
-        mod.Params.MIPGap = self.MIPGap
-        mod.Params.CutPasses = self.CutPasses
-        #
-        mod.Params.OptimalityTol = 1e-3
-        mod.Params.FeasibilityTol = 1e-3
-        mod.Params.IntFeasTol = 1e-3
-        #
-        if not self.TimeLimit is None:
-            mod.Params.TimeLimit = self.TimeLimit 
-
         #############
         # VARIABLES #
         #############
@@ -339,67 +554,18 @@ class my_sk():
         w_vnmt = mod.addVars(sets['w'], vtype=GRB.BINARY, 
                              name="w_vnmt")
         # stored energy at each time_step
+        # with bounds of tighten_bounds()
         s_vt = mod.addVars(sets['s_vt'], lb = 0.0, 
-                           ub = [self.S_v_max[v] 
+                           ub = [self.s_v_ub[v,t] 
                                  for (v,t) in sets['s_vt']], 
                            name="s_vt")
-        s_nt = mod.addVars(sets['s_nt'], lb = 0.0, 
-                           ub = [self.S_n_max[n] 
-                                 for (n,t) in sets['s_nt']], 
-                           name="s_nt")
-        e_nt = mod.addVars(sets['e_nt'], 
-                           lb = 0.0, name="e_nt")
+        s_nt, e_nt = self.add_storage_vars()
         # vehicles used (only if required)
         if self.min_vehicles:
             z_v = mod.addVars(self.vehicles, vtype=GRB.BINARY, 
                               name="z_v")
-
-        warm_starts = 0
-        # if available: use warm-start
-        if not(f_start is None):
-            for (v,n,t) in sets['f']:
-                try:
-                    f_vnt[v,n,t].start = f_start[v,n,t]
-                    warm_starts += 1
-                except KeyError:
-                    pass   
-        if not(w_start is None):
-            for (v,n,m,t) in sets['w']:
-                try: 
-                    w_vnmt[v,n,m,t].start = w_start[v,n,m,t]
-                    warm_starts += 1
-                except KeyError:
-                    pass
-        if not(s_n_start is None):
-            for (n,t) in sets['s_nt']:
-                try: 
-                    s_nt[n,t].start = s_n_start[n,t]
-                    warm_starts += 1
-                except KeyError:
-                    pass
-        if not(s_v_start is None):
-            for (v,t) in sets['s_vt']:
-                try: 
-                    s_vt[v,t].start = s_v_start[v,t]
-                    warm_starts += 1
-                except KeyError:
-                    pass
-        if z_start is not None and self.min_vehicles:
-            for v in self.vehicles:
-                try: 
-                    z_v[v].start = z_start[v]
-                    warm_starts += 1
-                except KeyError:
-                    pass
-        if e_start is not None:
-            for (n,t) in sets['e_nt']:
-                try: 
-                    e_nt[n,t].start = e_start[n,t]
-                    warm_starts += 1
-                except KeyError:
-                    pass
-
-        print(f'Applied {warm_starts} warmstarts...\n')
+        else: 
+            z_v = None
 
         # if available: fix values of f
         if not (f_fix is None):
@@ -412,91 +578,76 @@ class my_sk():
                 except KeyError:
                     pass   
 
-        #############
-        # OBJECTIVE #
-        #############
-        if self.obj == 0:
-            mod.setObjective(0, GRB.MINIMIZE)
-        elif self.obj == 1:
-            if self.min_vehicles:
-                mod.setObjective(z_v.prod(self.lambda_v,'*') + 
-                                 0.31*w_vnmt.prod(self.U_vnm, '*', 
-                                                  '*', '*','*') 
-                                 + 0.000001 * e_nt.sum('*','*'), 
-                                 GRB.MINIMIZE)            
-                print('Minimizing vehicle and energy costs...')    
-            else:
-                mod.setObjective(0.31*w_vnmt.prod(self.U_vnm, '*', 
-                                                  '*', '*','*')
-                                 + 0.000001 * e_nt.sum('*','*'), 
-                                 GRB.MINIMIZE)
-        else: 
-            exit('unknown objective_id, exiting...')
+        # coefficients of existing variables, read from the 
+        # parameter arrays of preprocess() (independent of t)
+        w_ind = np.array(sets['w'], dtype=int).reshape(-1, 4)
+        f_ind = np.array(sets['f'], dtype=int).reshape(-1, 3)
+        U_w = self.U_vnm[w_ind[:, 0], w_ind[:, 1], 
+                         w_ind[:, 2]].tolist()
+        P_f = self.P_vn[f_ind[:, 0], f_ind[:, 1]].tolist()
+        P_f_signed = self.P_vn_signed[f_ind[:, 0], 
+                                      f_ind[:, 1]].tolist()
+        w_list = list(w_vnmt.values())
+        f_list = list(f_vnt.values())
+        # group variables once by the indices used in the constraints, 
+        # so that each constraint family is built in a single pass
+        w_vt = group_keys(sets['w'], 0, 3)
+        w_from = group_keys(sets['w'], 0, 1, 3)
+        w_to = group_keys(sets['w'], 0, 2, 3)
+        f_v = group_keys(sets['f'], 0)
+        f_vt = group_keys(sets['f'], 0, 2)
+        f_nt = group_keys(sets['f'], 1, 2)
 
         ###############
         # CONSTRAINTS #
         ###############
-        if self.LogToConsole:      
+        if self.LogToConsole:
             print('Adding constraints...')
 
-        
+
         if self.constrain_vehicles is not None:
             mod.addConstr(z_v.sum('*') <= self.constrain_vehicles)
-        
+
 
         # each vehicle can only be located 
         # at one node at each timestep
-        mod.addConstrs((w_vnmt.sum(v, '*', '*', t) == 1) 
+        mod.addConstrs((lin_expr(w_list, w_vt.get((v, t), [])) == 1) 
                        for v in self.vehicles 
                        for t in self.times[1:-2])
 
         # vehicles start in depot
-        mod.addConstrs((w_vnmt.prod(self.depot_dict_0, v, '*', '*', 
-                                    self.times[0]) == 1) 
+        mod.addConstrs((lin_expr(w_list, 
+                                 [i for i in w_vt.get((v, self.times[0]), 
+                                                      []) 
+                                  if self.is_depot[sets['w'][i][1]]]) == 1) 
                         for v in self.vehicles)
 
         # vehicles end in depot
-        mod.addConstrs((w_vnmt.prod(self.depot_dict_N,v, '*', '*',
-                                    self.times[-2]) == 1) 
+        mod.addConstrs((lin_expr(w_list, 
+                                 [i for i in w_vt.get((v, self.times[-2]), 
+                                                      []) 
+                                  if self.is_depot[sets['w'][i][2]]]) == 1) 
                         for v in self.vehicles)
-        
+
         # connectivity constraints
-        mod.addConstrs((w_vnmt.sum(v, '*', n, t) == 
-                        w_vnmt.sum(v, n, '*', t+1)) 
+        mod.addConstrs((lin_expr(w_list, w_to.get((v, n, t), [])) == 
+                        lin_expr(w_list, w_from.get((v, n, t+1), []))) 
                        for v in self.vehicles for n in self.nodes 
                        for t in self.times[:-2])
-        
-        # capacity updates producers:
-        mod.addConstrs((s_nt[n, 1] == self.s_n0[n] 
-                        + self.E_nt[n, 0] 
-                        - f_vnt.prod(self.P_vn,'*', n, 0) 
-                        - e_nt[n, 0]) for n in self.producers)
-        mod.addConstrs((s_nt[n, t+1] == s_nt[n, t] 
-                        + self.E_nt[n, t] 
-                        - f_vnt.prod(self.P_vn,'*', n, t) 
-                        - e_nt[n, t]) for n in self.producers 
-                        for t in self.times[1:-1])
 
-        # capacity updates consumers:
-        if f_fix is None:
-            mod.addConstrs((s_nt[n, 1] == self.s_n0[n] 
-                            - self.E_nt[n, 0] 
-                            + f_vnt.prod(self.P_vn,'*', n, 0)) 
-                            for n in self.consumers)
-            mod.addConstrs((s_nt[n, t+1] == s_nt[n, t] 
-                            - self.E_nt[n, t] 
-                            + f_vnt.prod(self.P_vn,'*', n, t)) 
-                            for n in self.consumers 
-                            for t in self.times[1:-1])
+        self.add_storage_constrs(s_nt, e_nt, f_list, f_nt, P_f, 
+                                 consumers=f_fix is None)
 
         # capacity updates vehicles:
         mod.addConstrs((s_vt[v, 1] == self.s_v0[v] 
-                        + f_vnt.prod(self.P_vn_signed, v, '*', 0) 
-                        - w_vnmt.prod(self.U_vnm, v, '*','*', 0)) 
-                        for v in self.vehicles)                                              
+                        + lin_expr(f_list, f_vt.get((v, 0), []), 
+                                   P_f_signed) 
+                        - lin_expr(w_list, w_vt.get((v, 0), []), U_w)) 
+                        for v in self.vehicles)
         mod.addConstrs((s_vt[v, t+1] == s_vt[v, t] 
-                        + f_vnt.prod(self.P_vn_signed, v, '*', t) 
-                        - w_vnmt.prod(self.U_vnm, v, '*','*', t)) 
+                        + lin_expr(f_list, f_vt.get((v, t), []), 
+                                   P_f_signed) 
+                        - lin_expr(w_list, w_vt.get((v, t), []), U_w)) 
                         for v in self.vehicles 
                         for t in self.times[1:-1])
 
@@ -506,29 +657,295 @@ class my_sk():
         # optional: if vehicle is on the move, 
         # no (dis-)charging anywhere
         if self.constr_j:
-            mod.addConstrs((w_vnmt.prod(self.w_neq,v,'*','*',t) 
-                            <= 1 - f_vnt.sum(v,'*',t)) 
+            mod.addConstrs((lin_expr(w_list, 
+                                     [i for i in w_vt.get((v, t), []) 
+                                      if sets['w'][i][1] != sets['w'][i][2]]) 
+                            <= 1 - lin_expr(f_list, f_vt.get((v, t), []))) 
                             for (v,t) in sets['f_vt'])
         # count only vehicles that (dis-)charged
         M_j = self.t_steps
         if self.min_vehicles:
-            mod.addConstrs((f_vnt.sum(v,'*','*') <= M_j * z_v[v]) 
+            mod.addConstrs((lin_expr(f_list, f_v.get(v, [])) 
+                            <= M_j * z_v[v]) 
                            for v in self.vehicles)
         if self.limit_vehicles:
-            mod.addConstrs((f_vnt.sum('*', n, t) <= 
+            mod.addConstrs((lin_expr(f_list, f_nt.get((n, t), [])) <= 
                             self.n_charge[n]) 
                             for (n, t) in sets['f_nt'])
+
+        self.grb_vars = {'f_vnt': f_vnt, 'w_vnmt': w_vnmt,
+                         's_vt': s_vt, 's_nt': s_nt,
+                         'e_nt': e_nt, 'z_v': z_v,
+                         'f_list': f_list, 'w_list': w_list,
+                         'f_ind': f_ind, 'w_ind': w_ind, 'U_w': U_w, 
+                         'z_list': [] if z_v is None 
+                                   else list(z_v.values()), 
+                         'z_costs': self.lambda_v.tolist()}
+        self.model_settings = self.get_model_settings(f_fix)
+
+
+    def add_storage_vars(self):
+        '''
+        Add the soc s_nt of consumers and producers 
+        (with bounds of tighten_bounds()) and the curtailment e_nt 
+        of producers to self.mod.
+
+        Returns:
+            s_nt, e_nt (tupledict): gurobi variables
+        '''
+        sets = self.sets
+        s_nt = self.mod.addVars(sets['s_nt'], 
+                                lb = [self.s_n_lb[n,t] 
+                                      for (n,t) in sets['s_nt']], 
+                                ub = [self.s_n_ub[n,t] 
+                                      for (n,t) in sets['s_nt']], 
+                                name="s_nt")
+        e_nt = self.mod.addVars(sets['e_nt'], 
+                                lb = 0.0, name="e_nt")
+
+        return s_nt, e_nt
+
+
+    def add_storage_constrs(self, s_nt, e_nt, f_list, f_nt, P_f, 
+                            consumers=True):
+        '''
+        Add the capacity updates of producers and consumers.
+
+        Args:
+            s_nt, e_nt (tupledict): see add_storage_vars()
+            f_list (list): (dis-)charging variables
+            f_nt (dict): positions in f_list by (n,t)
+            P_f (list): energy per unit of f_list
+            consumers (bool): include the updates of consumers
+        '''
+        mod = self.mod
+        # capacity updates producers:
+        mod.addConstrs((s_nt[n, 1] == self.s_n0[n] 
+                        + self.E_nt[n, 0] 
+                        - lin_expr(f_list, f_nt.get((n, 0), []), P_f) 
+                        - e_nt[n, 0]) for n in self.producers)
+        mod.addConstrs((s_nt[n, t+1] == s_nt[n, t] 
+                        + self.E_nt[n, t] 
+                        - lin_expr(f_list, f_nt.get((n, t), []), P_f) 
+                        - e_nt[n, t]) for n in self.producers 
+                        for t in self.times[1:-1])
+
+        # capacity updates consumers:
+        if consumers:
+            mod.addConstrs((s_nt[n, 1] == self.s_n0[n] 
+                            - self.E_nt[n, 0] 
+                            + lin_expr(f_list, f_nt.get((n, 0), []), 
+                                       P_f)) 
+                            for n in self.consumers)
+            mod.addConstrs((s_nt[n, t+1] == s_nt[n, t] 
+                            - self.E_nt[n, t] 
+                            + lin_expr(f_list, f_nt.get((n, t), []), 
+                                       P_f)) 
+                            for n in self.consumers 
+                            for t in self.times[1:-1])
+
+
+    def get_model_settings(self, f_fix=None):
+        '''
+        Settings that change the structure of the model.
+        If any of them differs from the settings the current model
+        was built with, solve() builds the model from scratch.
+        '''
+        return (self.min_vehicles, self.constr_j, self.limit_vehicles,
+                self.constrain_vehicles, f_fix is None)
+
+
+    def apply_vehicle_set(self):
+        '''
+        Switch vehicles on or off via variable bounds.
+        Vehicles not contained in self.active_vehicles
+        (index-list, None for all vehicles) have to stay
+        in a depot and cannot (dis-)charge, which is
+        equivalent to removing them from the model.
+        '''
+        grb_vars = self.grb_vars
+        active = np.zeros(len(self.vehicles), dtype=bool)
+        if self.active_vehicles is None:
+            active[:] = True
+        else: 
+            active[list(self.active_vehicles)] = True
+        w_ind = grb_vars['w_ind']
+        f_ind = grb_vars['f_ind']
+        parked = (self.is_depot[w_ind[:, 1]]
+                  & (w_ind[:, 1] == w_ind[:, 2]))
+        w_ub = (active[w_ind[:, 0]] | parked).astype(float)
+        self.mod.setAttr('UB', grb_vars['w_list'], w_ub.tolist())
+        f_ub = active[f_ind[:, 0]].astype(float)
+        self.mod.setAttr('UB', grb_vars['f_list'], f_ub.tolist())
+        if grb_vars['z_v'] is not None:
+            self.mod.setAttr('UB', list(grb_vars['z_v'].values()),
+                             active.astype(float).tolist())
+
+
+    def update_model(self, f_fix=None):
+        '''
+        Prepare the model for the next run.
+        The model is only built if preprocess() was called before,
+        if its structural settings changed or if f_fix is given.
+        Otherwise, the previous model is reused and only
+        self.active_vehicles is applied via variable bounds.
+        '''
+        mod = self.mod
+        if (self.grb_vars is None or f_fix is not None
+            or self.model_settings != self.get_model_settings()):
+            self.build_model(f_fix)
+        else: 
+            # discard warm-starts of the previous run
+            mod.setAttr('Start', mod.getVars(),
+                        [GRB.UNDEFINED] * mod.NumVars)
+        if f_fix is None:
+            self.apply_vehicle_set()
+
+
+    def set_params(self, mod, probe=False):
+        '''
+        Apply the gurobi settings to mod, 
+        i.e. self.mod or its relaxation.
+        '''
+        mod.Params.LogFile = self.LogFile
+        mod.Params.LogToConsole = self.LogToConsole
+        mod.Params.threads = self.threads
+        mod.Params.method = self.method
+        mod.Params.MIPFocus = self.MIPFocus
+        mod.Params.MIPGap = self.MIPGap
+        mod.Params.CutPasses = self.CutPasses
+        #
+        mod.Params.OptimalityTol = 1e-3
+        mod.Params.FeasibilityTol = self.feas_tol
+        mod.Params.IntFeasTol = 1e-3
+        #
+        if not self.TimeLimit is None:
+            mod.Params.TimeLimit = self.TimeLimit 
+        # parameters persist when the model is reused
+        if probe:
+            mod.Params.SolutionLimit = 1
+        else:
+            mod.Params.SolutionLimit = GRB.MAXINT
+
+
+    def set_objective(self, probe=False):
+        '''
+        Set the objective self.obj, 0 in probe mode.
+        '''
+        mod = self.mod
+        U_w = self.grb_vars['U_w']
+        w_list = self.grb_vars['w_list']
+        e_nt = self.grb_vars['e_nt']
+        z_list = self.grb_vars['z_list']
+        z_costs = self.grb_vars['z_costs']
+        if self.obj == 0 or probe:
+            mod.setObjective(0, GRB.MINIMIZE)
+        elif self.obj == 1:
+            if self.min_vehicles:
+                mod.setObjective(LinExpr(z_costs, z_list) + 
+                                 0.31*LinExpr(U_w, w_list) 
+                                 + 0.000001 * e_nt.sum('*','*'), 
+                                 GRB.MINIMIZE)            
+                print('Minimizing vehicle and energy costs...')    
+            else:
+                mod.setObjective(0.31*LinExpr(U_w, w_list)
+                                 + 0.000001 * e_nt.sum('*','*'), 
+                                 GRB.MINIMIZE)            
+        else: 
+            exit('unknown objective_id, exiting...')
+
+
+    def solve(self, f_start=None, w_start=None, s_n_start=None, s_v_start=None,
+              z_start=None, e_start=None, f_fix=None, probe=False):
+        '''
+        Solve the model with Gurobi, see update_model().
+        In probe mode, the model is solved for feasibility only, 
+        i.e. with objective 0 and stopping at the first incumbent.
+
+        Args (optional):
+            f_start (dict): values to use as warm-start for f_vnt
+            w_start (dict): values to use as warm-start for w_vnmt
+            s_n_start (dict): values to use as warm-start for s_nt
+            s_v_start (dict): values to use as warm-start for s_vt
+            f_fix (dict): values to be fixed for f_vnt 
+            probe (bool): stop at the first feasible solution
+
+        Returns:
+            mod (GRB.Model object): solved gurobi-model
+        '''
+        mod = self.mod
+        self.update_model(f_fix)
+        self.set_params(mod, probe)
+
+        # if available: use warm-start
+        grb_vars = self.grb_vars
+        warm_starts = (set_start(mod, grb_vars['f_vnt'], f_start)
+                       + set_start(mod, grb_vars['w_vnmt'], w_start)
+                       + set_start(mod, grb_vars['s_nt'], s_n_start)
+                       + set_start(mod, grb_vars['s_vt'], s_v_start)
+                       + set_start(mod, grb_vars['e_nt'], e_start))
+        if self.min_vehicles:
+            warm_starts += set_start(mod, grb_vars['z_v'], z_start)
+
+        print(f'Applied {warm_starts} warmstarts...\n')
+
+        self.set_objective(probe)
         if self.write_lp:
             mod.write('model.lp')
 
         # Optimize model
         mod.optimize()
-        if mod.status == 2: 
+        if mod.status == 2 and not probe: 
             mod.printQuality()
 
         return mod
 
 
+    def check_feasibility(self, f_start=None, w_start=None, 
+                          s_n_start=None, s_v_start=None):
+        '''
+        Probe the model for feasibility, see solve(). 
+        The solution of a feasible probe is left in self.mod.
+
+        Args (optional):
+            f_start, w_start, s_n_start, s_v_start (dict): 
+                warm-starts as in solve()
+        Returns:
+            result (probe_result): status (FEASIBLE, INFEASIBLE 
+                or UNKNOWN) and runtime of gurobi
+        '''
+        mod = self.solve(f_start=f_start, w_start=w_start, 
+                         s_n_start=s_n_start, s_v_start=s_v_start, 
+                         probe=True)
+
+        return probe_result(get_probe_status(mod.status), mod.Runtime)
+
+
+    def check_relaxation(self):
+        '''
+        Screen the model by its LP relaxation, solved for 
+        feasibility only (objective 0): an infeasible relaxation 
+        proves infeasibility of the model, otherwise the 
+        outcome is unknown.
+
+        Returns:
+            result (probe_result): status (INFEASIBLE or UNKNOWN) 
+                and runtime of the relaxation
+        '''
+        self.update_model()
+        self.set_objective(probe=True)
+        rel = self.mod.relax()
+        self.set_params(rel)
+        rel.optimize()
+        status = UNKNOWN
+        if get_probe_status(rel.status) == INFEASIBLE:
+            status = INFEASIBLE
+        result = probe_result(status, rel.Runtime, True)
+        rel.dispose()
+
+        return result
+
+
     def postprocess(self, mod):
         '''
         Write solution to output files, 
@@ -545,14 +962,16 @@ class my_sk():
             exit()
 
         # save, plot, etc.
-        filepath = os.path.join(self.out_dir, self.instance_str + '.txt')
+        filepath = os.path.join(self.out_dir, self.instance_str + '.npz')
 
-        varlist = mod.getVars()
-        with open(filepath, 'w') as out_file:
-            for v in varlist:
-                if hasattr(v, 'x'):
-                    out_file.write( '%s %g' % (v.varName, v.x) )
-                    out_file.write('\n')
+        values = {}
+        for var in solution_vars:
+            grb_vars = self.grb_vars[var]
+            if grb_vars is None or len(grb_vars) == 0:
+                continue
+            values[var] = dict(zip(grb_vars.keys(), 
+                                   mod.getAttr('X', grb_vars.values())))
+        write_solution(filepath, values, self.compress_solution)
 
         model_dict = {'times': self.times,
                        't_0': self.t_0,                
@@ -570,7 +989,10 @@ class my_sk():
                        'v_names': self.v_names,
                        'S_v_max': self.S_v_max,
                        's_v0': self.s_v0,
-                       'P_vn': self.P_vn,
+                       'P_vn': {(v, n, t): self.P_vn[v, n] 
+                                for v in self.vehicles 
+                                for n in self.N_pc 
+                                for t in self.times},
                        'E_nt': self.E_nt,
                         }
         pickle_path = os.path.join(self.out_dir, self.instance_str + '.p')
@@ -4,7 +4,13 @@ import pandas as pd
 from datetime import datetime, timedelta
 import glob
 import os
-from itertools import combinations
+import heapq
+import hashlib
+import pickle
+import argparse
+import io
+from collections import defaultdict
+from operator import itemgetter
 import logging
 import sys
 
@@ -13,13 +19,18 @@ dir_path = os.path.dirname(os.path.realpath(__file__))
 ###################
 # GENERAL PURPOSE #
 ###################
-def read_variables(grb_mod):
+def read_variables(grb_mod, grb_vars=None):
     '''
     Read results from a previously solved gurobi model 
     and return dictionaries for further use.
+    If the tupledicts of the model are given, values are 
+    read in bulk and only non-zero values are stored, 
+    i.e. the dictionaries return zero for all other indices.
+    Otherwise, indices are parsed from the variable names.
 
     Args:
         grb_mod (GUROBI.model): solved gurobi-model 
+        grb_vars (dict): tupledicts of the model, see my_sk.solve()
     Returns:
         f_vnt (dict): 1 if vehicle v is (dis-)charging 
                       at node n at time t, 0 else
@@ -31,6 +42,16 @@ def read_variables(grb_mod):
                      in vehicle v at time t (in kWh)
     '''
 
+    if grb_vars is not None:
+        results = []
+        for var in ['f_vnt', 'w_vnmt', 's_nt', 's_vt']:
+            values = defaultdict(float)
+            x = grb_mod.getAttr('X', grb_vars[var].values())
+            values.update((ind, val) for ind, val 
+                          in zip(grb_vars[var].keys(), x) if val != 0)
+            results.append(values)
+        return tuple(results)
+
     f_vnt = {}
     w_vnmt = {}
     s_nt = {}
@@ -124,11 +145,8 @@ def get_pd_frame(n_type, source, n_max, lat, lon):
                 'lat','lon']
     elif n_type in ['D','O']:
         cols = ['ID','lat','lon']
-    if os.path.isdir(source):
-        files = glob.glob(os.path.join(source, '*.CSV'))
-    elif os.path.isfile(source) and source.endswith('.csv'):
-        files = [source]
-    else:
+    files = get_source_files(source)
+    if files is None:
         exit(f'Cannot interpret source {source}')
 
     pd_frame = pd.DataFrame(columns=cols)
@@ -148,6 +166,24 @@ def get_pd_frame(n_type, source, n_max, lat, lon):
     return pd_frame[:n_max]
 
 
+def get_source_files(source):
+    '''
+    Return the CSV-files to be read for a data source, 
+    None if the source cannot be interpreted.
+
+    Args:
+        source (str): single CSV-file or path to folder containing CSV-files
+    Returns:
+        files (list): paths of CSV-files
+    '''
+    if os.path.isdir(source):
+        return glob.glob(os.path.join(source, '*.CSV'))
+    elif os.path.isfile(source) and source.endswith('.csv'):
+        return [source]
+
+    return None
+
+
 def get_vehicle_data(yaml_dict):
     '''
     Find vehicle files in the specified directory 
@@ -166,11 +202,8 @@ def get_vehicle_data(yaml_dict):
     cols = ['ID','cap[kWh]','cap_0[kWh]','node_0',
             'consumption[kWh/km]','power_cdc[kW]',
             'speed[km/h]','name','costs']
-    if os.path.isdir(vehicle_src):
-        vehicle_files = glob.glob(os.path.join(vehicle_src,'*.CSV'))
-    elif os.path.isfile(vehicle_src) and vehicle_src.endswith('.csv'):
-        vehicle_files = [vehicle_src]
-    else:
+    vehicle_files = get_source_files(vehicle_src)
+    if vehicle_files is None:
         exit(f'Could not interpet vehicle source {vehicle_src}!')
 
     vehicle_data = pd.DataFrame(columns=cols)
@@ -190,54 +223,136 @@ def get_vehicle_data(yaml_dict):
 def get_gc_distance(lat_1, lon_1, lat_2, lon_2):
     '''
     calculates direct great circle distance 
-    between two points using haversine formula
+    between two points using haversine formula.
+    Works on scalars as well as on broadcastable arrays.
     '''
     R = 6373.0
 
-    lat_1 = math.radians(lat_1)
-    lon_1 = math.radians(lon_1)
-    lat_2 = math.radians(lat_2)
-    lon_2 = math.radians(lon_2)
+    lat_1 = np.radians(lat_1)
+    lon_1 = np.radians(lon_1)
+    lat_2 = np.radians(lat_2)
+    lon_2 = np.radians(lon_2)
 
     d_lon = lon_2 - lon_1
     d_lat = lat_2 - lat_1
 
-    a = math.sin(d_lat / 2)**2 + math.cos(lat_1) * math.cos(lat_2) * math.sin(d_lon / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    a = np.sin(d_lat / 2)**2 + np.cos(lat_1) * np.cos(lat_2) * np.sin(d_lon / 2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
     distance = R * c
     return distance
 
 
-def get_distance(node_data, type):
+def get_distance(node_data, type, block_size=1024, 
+                 max_float64=2048):
     '''
-    calculate all distances between nodes depending on type
+    calculate all distances between nodes depending on type.
+    Rows are evaluated in blocks of *block_size* nodes 
+    to limit the size of temporary arrays.
 
     Args: 
         node_data (pd.DataFrame): DataFrame of considered nodes
         type (str): Type of distance calculation, e.g. 'air' for
                     direct distance 
+        block_size (int): number of rows evaluated at once
+        max_float64 (int): larger node sets are returned as 
+                           float32 to save memory
+    Returns:
+        dist (np.array): distances between all nodes (in km)
     '''
+    if type != 'air':
+        exit('type of distance calculation not supported')
     n_nodes = node_data.shape[0]
-    lon = node_data['lon'].values
-    lat = node_data['lat'].values
-
-    dist = np.empty((n_nodes,n_nodes)) 
-    for n in range(n_nodes):
-        for m in range(n_nodes):
-            if type == 'air':
-                dist[n,m] = get_gc_distance(lat[n], lon[n], 
-                                            lat[m], lon[m])
-            else:
-                exit('type of distance calculation not supported')
+    lon = node_data['lon'].values.astype(float)
+    lat = node_data['lat'].values.astype(float)
+
+    if n_nodes > max_float64:
+        dtype = np.float32
+    else:
+        dtype = np.float64
+    dist = np.empty((n_nodes,n_nodes), dtype=dtype) 
+    for start in range(0, n_nodes, block_size):
+        end = min(start + block_size, n_nodes)
+        dist[start:end] = get_gc_distance(lat[start:end, None], 
+                                          lon[start:end, None], 
+                                          lat[None, :], lon[None, :])
 
     return dist
 
 
+class profile_store():
+    '''
+    Profiles are parsed only once per file and stored as 
+    cumulative energy (per kW of peak) at each minute of the day. 
+    The energy of any interval then is the difference of 
+    two cumulative values, days are repeated periodically.
+    Resampled profiles are memoised per time grid.
+    '''
+    def __init__(self, profile_dir=os.path.join('data','profiles')):
+        self.profile_dir = profile_dir
+        self.cum_energy = {}
+        self.grids = {}
+
+    def get_cum_energy(self, profile):
+        '''
+        Return cumulative energy of a profile at minutes 0...1440.
+        Each entry of the CSV-file is valid until the next one.
+
+        Args:
+            profile (str): name of the CSV-file
+        Returns:
+            cum_energy (np.array): energy (in kWh per kW of peak)
+        '''
+        if profile not in self.cum_energy:
+            frame = pd.read_csv(os.path.join(self.profile_dir, profile))
+            minutes = np.array([int(t[:2])*60 + int(t[3:5]) 
+                                for t in frame['time'].values])
+            slots = np.searchsorted(minutes, np.arange(24*60), 
+                                    side='right') - 1
+            # energy per minute
+            energy = frame['peak_percentage'].values[slots] / 60.
+            self.cum_energy[profile] = np.concatenate(
+                                       ([0.], np.cumsum(energy)))
+
+        return self.cum_energy[profile]
+
+    def get_grid(self, profile, t_0, delta_t, t_steps):
+        '''
+        Return the energy of a profile (per kW of peak) during 
+        all intervals [t,t+delta_t] of a time grid. 
+        The last time instance has no interval, i.e. zero energy.
+
+        Args:
+            profile (str): name of the CSV-file
+            t_0 (str): string of initial time instance, e.g. '10:30'
+            delta_t (float): length of time-step (in h)
+            t_steps (int): amount of time instances to be considered
+        Returns:
+            grid (np.array): energy of each interval
+        '''
+        key = (profile, t_0, delta_t, t_steps)
+        if key not in self.grids:
+            cum_energy = self.get_cum_energy(profile)
+            step = int(round(delta_t*60))
+            bounds = (int(t_0[:2])*60 + int(t_0[3:5]) 
+                      + step*np.arange(t_steps))
+            days, minutes = np.divmod(bounds, 24*60)
+            cum = days*cum_energy[-1] + cum_energy[minutes]
+            grid = np.zeros(t_steps)
+            grid[:-1] = np.diff(cum)
+            self.grids[key] = grid
+
+        return self.grids[key]
+
+
+# shared by all models of a process
+profiles_store = profile_store()
+
+
 def get_profiles(nodes, peak, profiles, t_0, delta_t, t_steps):
     '''
     Read profiles and return it in granularity as specified.
-    This function expects data to be defined in 0.25h steps
-    and delta_t to be a multiple of 0.25h as well.
+    delta_t has to be a whole number of minutes, 
+    profiles are resampled via profiles_store.
 
     Args:
         nodes (list): index-list of nodes featuring a profile
@@ -250,43 +365,144 @@ def get_profiles(nodes, peak, profiles, t_0, delta_t, t_steps):
         delta_t (float): length of time-step (in h)
         t_steps (int): amount of time instances to be considered     
     Returns:
-        E_nt (dict): consumed or produced energy by node n during 
-                     interval [t,t+delta_t]
+        E_nt (np.array): consumed or produced energy by node n during 
+                         interval [t,t+delta_t], zero for other nodes
     '''
-    if not ((delta_t % 0.25)==0 or delta_t==0.05):
+    if abs(delta_t*60 - round(delta_t*60)) > 1e-6 or delta_t <= 0:
         exit('Bad delta_t: {}'.format(delta_t)) 
 
-    E_nt = {}
-    t_0_dt = datetime.strptime(t_0, '%H:%M')
-
+    E_nt = np.zeros((len(peak), t_steps))
     for n in nodes:
-        profile = pd.read_csv(os.path.join('data','profiles',
-                              profiles[n]))
-        times = profile['time'].values
-        # energy that is produced/consumed in each 15 min interval
-        energy = profile['peak_percentage'].values * peak[n] * 0.25
-        for t in range(t_steps):
-            # set E to zero when charging is not possible
-            #if t in [0, t_steps-2, t_steps-1]:
-            if t in [t_steps-1]:
-                E_nt[n,t] = 0
-                continue
-            t_dt = t_0_dt + timedelta(hours=t*delta_t)
-            t_str = t_dt.strftime('%H:%M')
-
-            if (delta_t % 0.25)==0:
-                t_dt_next = t_0_dt + timedelta(hours=(t+1)*delta_t)
-                t_str_next = t_dt_next.strftime('%H:%M')
-                first_ind = np.where(times==t_str)[0][0]
-                last_ind = np.where(times==t_str_next)[0][0] - 1 
-                E_nt[n, t] = sum(energy[first_ind:(last_ind+1)])
-            else:
-                ind = np.where(times>t_str)[0][0] - 1 
-                E_nt[n, t] = energy[ind] / 5. 
+        E_nt[n] = peak[n] * profiles_store.get_grid(profiles[n], t_0, 
+                                                    delta_t, t_steps)
 
     return E_nt
 
 
+# config entries the compiled instance depends on
+instance_fields = ['vehicle_dir', 'depot_dir', 'consumer_dir', 
+                   'producer_dir', 'other_dir', 'v_max', 'c_max', 
+                   'p_max', 'o_max', 'd_max', 'lat', 'lon', 
+                   't_0', 'T', 'delta_t']
+# increase if the compiled data changes, e.g. in get_distance()
+instance_version = 3
+
+
+def get_file_hash(path):
+    '''
+    Return the md5-hash of the contents of a file.
+    '''
+    with open(path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def get_instance_key(yaml_dict):
+    '''
+    Hash the data-relevant entries of a config together with 
+    the contents of all node- and vehicle-files it refers to.
+    Profiles are only known after reading the node data, 
+    they are validated in read_instance().
+
+    Args:
+        yaml_dict (dict): dictionary from the config file
+    Returns:
+        key (str): key of the compiled instance
+    '''
+    h = hashlib.sha1()
+    h.update(str(instance_version).encode())
+    for field in instance_fields:
+        h.update('{}={};'.format(field, yaml_dict[field]).encode())
+    sources = [yaml_dict['depot_dir'], yaml_dict['consumer_dir'], 
+               yaml_dict['producer_dir'], yaml_dict['other_dir'], 
+               os.path.join(dir_path, yaml_dict['vehicle_dir'])]
+    for source in sources:
+        for path in sorted(get_source_files(source) or []):
+            h.update(get_file_hash(path).encode())
+
+    return h.hexdigest()
+
+
+def read_instance(cache_dir, key):
+    '''
+    Load a compiled instance, see write_instance().
+
+    Args:
+        cache_dir (str): directory of compiled instances
+        key (str): key from get_instance_key()
+    Returns:
+        instance (dict): compiled instance, None if it does 
+                         not exist or its profiles changed
+    '''
+    path = os.path.join(cache_dir, key + '.p')
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            instance = pickle.load(f)
+        for profile, file_hash in instance['profile_hashes'].items():
+            if get_file_hash(profile) != file_hash:
+                return None
+    except Exception:
+        return None
+
+    return instance
+
+
+def write_instance(cache_dir, key, instance, profiles):
+    '''
+    Store a compiled instance, i.e. node_data, dist, E_nt 
+    and vehicle_data, together with hashes of the profiles, 
+    which are located as in get_profiles().
+    The file is written atomically, since several processes 
+    might compile the same instance.
+
+    Args:
+        cache_dir (str): directory of compiled instances
+        key (str): key from get_instance_key()
+        instance (dict): data to be stored
+        profiles (list): names of the profiles used
+    '''
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    instance = dict(instance)
+    instance['profile_hashes'] = {}
+    for profile in set(profiles):
+        path = os.path.abspath(os.path.join(profiles_store.profile_dir, 
+                                            profile))
+        instance['profile_hashes'][path] = get_file_hash(path)
+    path = os.path.join(cache_dir, key + '.p')
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(instance, f)
+    os.replace(tmp_path, path)
+
+
+def group_keys(keys, *positions):
+    '''
+    Group index-tuples by the entries at the given positions 
+    in a single pass, e.g. group_keys(sets['w'], 0, 3) groups 
+    all arcs (v,n,m,t) by (v,t).
+
+    Args:
+        keys (list): list of index-tuples, e.g. sets['w']
+        positions (int): positions of the entries to group by
+    Returns:
+        groups (dict): maps the reduced index (a tuple if more 
+                       than one position is given) to the list 
+                       of positions in *keys* belonging to it
+    '''
+    get_sub_key = itemgetter(*positions)
+    groups = {}
+    for i, key in enumerate(keys):
+        sub_key = get_sub_key(key)
+        if sub_key in groups:
+            groups[sub_key].append(i)
+        else:
+            groups[sub_key] = [i]
+
+    return groups
+
+
 #############
 # HEURISTIC #
 #############
@@ -304,43 +520,29 @@ def score_function(mod):
 
     v_data = mod.vehicle_data
     node_data = mod.node_data
-    E_nt = mod.E_nt
-    times = mod.times
-
-    node_data = node_data[node_data['type'].isin(['C','P'])].copy()
-    nodes = node_data.index.tolist()
-
-    # calc average E_nt of node, 
-    E_list = []
-    for n in nodes:
-        sum_n = 0
-        for t in times[1:-2]:
-            sum_n += E_nt[n,t]
-        E_list.append(sum_n/len(times))
-
-    cap_E = E_list + node_data['cap[kWh]'].values
-    node_data['cap+E'] = cap_E
-    node_data['through'] = pd.concat([node_data['power_cdc[kW]']*
-                                      mod.delta_t,
-                                      node_data['cap+E']], 
-                                      axis=1).min(axis=1) 
-    v_data['through'] = pd.concat([v_data['power_cdc[kW]']*
-                                   mod.delta_t,v_data['cap[kWh]']],
-                                   axis=1).min(axis=1)
-    
-    theta_eff_list = []
-    for index, row in v_data.iterrows():
-        theta_vn = [min(n_through, row['through']) 
-                    for n_through in node_data['through'].values]
-        N_vn = [max(1,row['cap[kWh]'] / t_vn ) 
-                for t_vn in theta_vn]
-        f_vn = [min(N / (N+2+1),(len(times)-3-2)/(len(times)-3)) 
-                for N in N_vn]
-        theta_avg = [f*theta for f,theta in zip(f_vn,theta_vn)]
-        theta_eff = sum(theta_avg)/len(theta_avg)            
-        theta_eff_list.append(theta_eff)
-
-    v_data['theta_eff'] = theta_eff_list    
+    n_times = len(mod.times)
+
+    nodes = node_data.index[node_data['type'].isin(['C','P'])].tolist()
+    node_data = node_data.loc[nodes]
+
+    # average E_nt of node and throughput of nodes and vehicles 
+    # during one time step
+    E_avg = mod.E_nt[nodes, 1:n_times-2].sum(axis=1) / n_times
+    cap_E = E_avg + node_data['cap[kWh]'].values.astype(float)
+    n_through = np.minimum(node_data['power_cdc[kW]'].values.astype(
+                           float) * mod.delta_t, cap_E)
+    v_cap = v_data['cap[kWh]'].values.astype(float)
+    v_data['through'] = np.minimum(v_data['power_cdc[kW]'].values.astype(
+                                   float) * mod.delta_t, v_cap)
+
+    # (V, N) matrices of throughput between vehicles and nodes, 
+    # number of steps to (dis-)charge completely and share of time 
+    # (dis-)charging, given two steps of travel and one of idling
+    theta_vn = np.minimum(v_data['through'].values[:, np.newaxis], 
+                          n_through[np.newaxis, :])
+    N_vn = np.maximum(1, v_cap[:, np.newaxis] / theta_vn)
+    f_vn = np.minimum(N_vn / (N_vn+2+1), (n_times-3-2)/(n_times-3))
+    v_data['theta_eff'] = (f_vn * theta_vn).mean(axis=1)
     v_data['score'] = v_data['theta_eff'].div(v_data['costs'])
 
     return v_data
@@ -375,31 +577,13 @@ def init_set(mod):
     consumers = node_data.index[node_data['type'] == 'C'].tolist()
     producers = node_data.index[node_data['type'] == 'P'].tolist()
 
-    # calculate cumulative energies of consumer and producer 
-    # for all times 
-    energy_c = []
-    energy_p = []
-    energy_cp = []
-    for t in times[1:-2]:
-        sum_energy_cp = 0
-        sum_energy_c = 0
-        for c in consumers:
-            sum_energy_c += E_nt[c,t]
-            sum_energy_cp += E_nt[c,t]
-        sum_energy_p = 0
-        for p in producers:
-            sum_energy_p += E_nt[p,t]
-            sum_energy_cp += E_nt[p,t]
-        energy_c.append(sum_energy_c) 
-        energy_p.append(sum_energy_p)
-        energy_cp.append(sum_energy_cp)
-    
-    init_energy_p = 0
-    for p in producers:
-        init_energy_p += s_n_0[p]
-    init_energy_c = 0
-    for c in consumers:
-        init_energy_c += s_n_0[c]
+    # energies of consumers and producers during the time steps 
+    # considered for (dis-)charging 
+    n_times = len(times)
+    energy_c = E_nt[consumers, 1:n_times-2].sum(axis=0)
+    energy_p = E_nt[producers, 1:n_times-2].sum(axis=0)
+    init_energy_p = s_n_0[producers].sum()
+    init_energy_c = s_n_0[consumers].sum()
 
     req_energy = sum(energy_c)-init_energy_c
     av_energy = sum(energy_p)+init_energy_p
@@ -422,11 +606,12 @@ def init_set(mod):
 
     # add vehicles greedy until threshold is met
     threshold = avg_throughput
+    pool = vehicle_pool(v_data['score'])
     v_set = []
     sum_theta = 0
     while sum_theta < threshold:
         old_set = v_set
-        v_set, log = add_greedy(v_data, v_set)
+        v_set, log = add_greedy(v_data, pool)
         if v_set is None:
             log_str += '\nRequired throughput exceeds all vehicles'
             log_str += ' using full set...'
@@ -442,7 +627,109 @@ def init_set(mod):
     return v_set, log_str
 
 
-def add_greedy(v_data, v_set):
+class vehicle_pool():
+    '''
+    Vehicle set of the heuristic with membership tracking. 
+    Vehicles in the set are kept in a min-heap and unused vehicles 
+    in a max-heap over their score, so that the vehicle to be 
+    removed or added next is found in O(log V). Ties are broken 
+    by the order of insertion and by index, respectively. 
+    Heap entries of vehicles that changed sides in the meantime 
+    are discarded lazily.
+    '''
+    def __init__(self, scores, v_set=()):
+        '''
+        Args:
+            scores (pd.Series): score of each vehicle index
+            v_set (list): initial indices of vehicles in the set
+        '''
+        self.scores = pd.to_numeric(scores).values.tolist()
+        self.reset(v_set)
+
+
+    def reset(self, v_set):
+        '''
+        Replace the vehicle set, keeping the order of v_set.
+        '''
+        # ordered set, mapping vehicles to their order of insertion
+        self.members = {}
+        for v in v_set:
+            self.members.setdefault(v, len(self.members))
+        self.used = [(self.scores[v], i, v) 
+                     for v, i in self.members.items()]
+        self.n_added = len(self.used)
+        self.unused = [(-score, v) for v, score in enumerate(self.scores) 
+                       if v not in self.members]
+        heapq.heapify(self.used)
+        heapq.heapify(self.unused)
+
+
+    def __contains__(self, v):
+        return v in self.members
+
+
+    def __len__(self):
+        return len(self.members)
+
+
+    def add(self, v):
+        self.members[v] = self.n_added
+        heapq.heappush(self.used, (self.scores[v], self.n_added, v))
+        self.n_added += 1
+
+
+    def remove(self, v):
+        del self.members[v]
+        heapq.heappush(self.unused, (-self.scores[v], v))
+
+
+    def get_set(self):
+        '''
+        Returns:
+            v_set (list): indices of the vehicles in the set
+        '''
+        return list(self.members)
+
+
+    def get_unused(self):
+        '''
+        Returns:
+            unused (list): indices of the vehicles not in the set
+        '''
+        return [v for v in range(len(self.scores)) 
+                if v not in self.members]
+
+
+    def best_unused(self):
+        '''
+        Returns:
+            v (int): unused vehicle with the highest score, 
+                     None if all vehicles are used
+        '''
+        while self.unused and self.unused[0][1] in self.members:
+            heapq.heappop(self.unused)
+        if not self.unused:
+            return None
+
+        return self.unused[0][1]
+
+
+    def worst_used(self):
+        '''
+        Returns:
+            v (int): vehicle in the set with the lowest score, 
+                     None if the set is empty
+        '''
+        while (self.used and 
+               self.members.get(self.used[0][2]) != self.used[0][1]):
+            heapq.heappop(self.used)
+        if not self.used:
+            return None
+
+        return self.used[0][2]
+
+
+def add_greedy(v_data, pool):
     '''
     Adds the vehicle with the highest score 
     to the current vehicle set
@@ -450,50 +737,280 @@ def add_greedy(v_data, v_set):
     Args:
         v_data (pd.Dataframe): dataframe containing 
                                all vehicle data
-        v_set (list): list of indices for vehicles 
-                      included in the current set
+        pool (vehicle_pool): current vehicle set
     Returns:
         v_set (list): new list including the added vehicle
         log_str (str): logging string containing information 
     '''
-    unused = v_data.drop(v_set)
-    if unused.shape[0] == 0:
+    max_index = pool.best_unused()
+    if max_index is None:
         log_str = 'No vehicles left to add, problem is infeasible!'        
         return None, log_str
- 
-    unused['score'] = pd.to_numeric(unused['score'])
-    max_index = unused['score'].idxmax()
 
     log_str = '\nAdding {} ({}) to {}...'.format(max_index, 
-                v_data['name'].values[max_index], v_set)
-    v_set.append(max_index)
+                v_data['name'].values[max_index], pool.get_set())
+    pool.add(max_index)
 
-    return v_set, log_str
+    return pool.get_set(), log_str
 
 
-def remove_greedy(v_data, v_set):
+def remove_greedy(v_data, pool):
     '''
     Removes the vehicle with the lowest score from a vehicle set.
 
     Args:
         v_data (pd.Dataframe): dataframe containing 
                                all vehicle data
-        v_set (list): list of indices for vehicles 
-                      included in the current set
+        pool (vehicle_pool): current vehicle set
     Returns:
         v_set (list): new list without the removed vehicle
         log_str (str): logging string containing information
     '''
-    used = v_data.iloc[v_set,:]
-    score = pd.to_numeric(used['score'])
-    min_index = score.idxmin()
+    min_index = pool.worst_used()
 
     log_str = '\nRemoving {} ({}) from {}...'.format(min_index, 
-                v_data['name'].values[min_index], v_set)
+                v_data['name'].values[min_index], pool.get_set())
+    pool.remove(min_index)
 
-    v_set.remove(min_index)
+    return pool.get_set(), log_str
 
-    return v_set, log_str
+
+class feasibility_cache():
+    '''
+    Cache of feasibility results for vehicle sets.
+    Vehicles of the same type are interchangeable, so sets are 
+    stored as multisets of types. Feasibility is monotone:
+    - every sub-multiset of an infeasible set is infeasible
+    - every super-multiset of a feasible set is feasible
+    Both dominance queries are answered via bitsets: for each type k 
+    and count c, the integer ge[k][c] has bit i set if the i-th 
+    stored set contains at least c vehicles of type k.
+    '''
+    def __init__(self, types):
+        '''
+        Args:
+            types (list): type (e.g. name) of each vehicle index
+        '''
+        self.types = types
+        self.type_ids = {}
+        self.n_sets = {True: 0, False: 0}
+        self.all_sets = {True: 0, False: 0}
+        self.ge = {True: {}, False: {}}
+
+
+    def get_counts(self, v_set):
+        '''
+        Returns:
+            counts (dict): number of vehicles per type id in v_set
+        '''
+        counts = {}
+        for v in v_set:
+            k = self.type_ids.setdefault(self.types[v], 
+                                         len(self.type_ids))
+            counts[k] = counts.get(k, 0) + 1
+
+        return counts
+
+
+    def get_key(self, v_set):
+        '''
+        Returns:
+            key (frozenset): multiset of types in v_set, equal 
+                             for sets of interchangeable vehicles
+        '''
+        return frozenset(self.get_counts(v_set).items())
+
+
+    def get_mask(self, feasible, k, c):
+        '''
+        Returns:
+            mask (int): bitset of stored (in)feasible sets
+                        with at least c vehicles of type k
+        '''
+        if c <= 0:
+            return self.all_sets[feasible]
+        masks = self.ge[feasible].get(k)
+        if masks is None or c >= len(masks):
+            return 0
+
+        return masks[c]
+
+
+    def add(self, v_set, feasible):
+        '''
+        Store the feasibility result of a vehicle set.
+        Sets already implied by previous results are skipped.
+
+        Args:
+            v_set (list): list of vehicle indices
+            feasible (bool): True if v_set is feasible
+        '''
+        if self.check(v_set) == feasible:
+            return
+        bit = 1 << self.n_sets[feasible]
+        self.n_sets[feasible] += 1
+        self.all_sets[feasible] |= bit
+        for k, c in self.get_counts(v_set).items():
+            masks = self.ge[feasible].setdefault(k, [0])
+            while len(masks) <= c:
+                masks.append(0)
+            for i in range(1, c+1):
+                masks[i] |= bit
+
+
+    def check(self, v_set):
+        '''
+        Check whether the feasibility of a vehicle set 
+        is implied by previously stored results.
+
+        Args:
+            v_set (list): list of vehicle indices
+        Returns:
+            feasible (bool): True if v_set contains a feasible set, 
+                             False if it is contained in an 
+                             infeasible set, None if unknown
+        '''
+        counts = self.get_counts(v_set)
+        # a feasible set F is contained in v_set, 
+        # if no type occurs more often in F than in v_set
+        exceeding = 0
+        for k in self.ge[True]:
+            exceeding |= self.get_mask(True, k, counts.get(k, 0) + 1)
+        if self.all_sets[True] & ~exceeding:
+            return True
+        # v_set is contained in an infeasible set I, 
+        # if I features at least as many vehicles of each type
+        containing = self.all_sets[False]
+        for k, c in counts.items():
+            containing &= self.get_mask(False, k, c)
+            if not containing:
+                break
+        if containing:
+            return False
+
+        return None
+
+
+def get_hops(reachable, sources, max_hops):
+    '''
+    Minimum number of time steps to reach each node from any of 
+    the source nodes (breadth-first search on the arcs that can 
+    be travelled within one time step).
+
+    Args:
+        reachable (np.array): boolean (N, N) adjacency matrix
+        sources (np.array): boolean mask of the N source nodes
+        max_hops (int): number of steps to be considered
+    Returns:
+        hops (np.array): steps per node, np.inf if not reachable
+    '''
+    hops = np.full(len(sources), np.inf)
+    hops[sources] = 0
+    visited = sources.copy()
+    frontier = sources.copy()
+    for h in range(1, max_hops+1):
+        frontier = reachable[frontier].any(axis=0) & ~visited
+        if not frontier.any():
+            break
+        hops[frontier] = h
+        visited |= frontier
+
+    return hops
+
+
+class feasibility_screen():
+    '''
+    Necessary conditions for the feasibility of a vehicle set, 
+    checked without building the MIP. 
+    Consumer n runs empty at time t, unless its deficit 
+    D_nt = sum(E_n0..E_n(t-1)) - s_n0 has been discharged by then. 
+    Upper bounds on the energy dischargeable until t are
+    - per consumer: power of the vehicles able to reach n 
+      from a depot and return in time, limited to the 
+      n_charge strongest ones if limit_vehicles is set
+    - in total: each vehicle discharges at one node per step
+    - in total: initial soc of the vehicles plus initial 
+      and produced energy of all producers
+    '''
+    def __init__(self, mod, v_data, tol=1e-3):
+        '''
+        Args:
+            mod (smart_krit.my_sk object): model with initialized nodes
+            v_data (pd.DataFrame): data of all vehicles
+            tol (float): feasibility tolerance per time step
+        '''
+        consumers = mod.consumers
+        n_steps = mod.t_steps - 1
+        self.names = mod.n_names[consumers]
+        self.tol = tol * mod.t_steps
+        self.limit_vehicles = mod.limit_vehicles
+        self.n_charge = mod.n_charge[consumers].astype(float)
+        P_v = v_data['power_cdc[kW]'].values.astype(float)
+        speed = v_data['speed[km/h]'].values.astype(float)
+        P_n = mod.P_n[consumers].astype(float)
+        P_vn = np.minimum(P_v[:, np.newaxis], 
+                          P_n[np.newaxis, :]) * mod.delta_t
+        self.s_v0 = np.asarray(mod.get_s_v0(v_data), dtype=float)
+
+        # serve[v,n,t]: v can stay at consumer n during step t, 
+        # (dis-)charging is only modelled for steps 1..n_steps-2
+        steps = np.arange(n_steps)
+        is_depot = np.zeros(len(mod.nodes), dtype=bool)
+        is_depot[mod.depots] = True
+        serve = np.zeros((len(v_data), len(consumers), n_steps), 
+                         dtype=bool)
+        for v_speed in np.unique(speed):
+            reachable = mod.dist / v_speed <= mod.delta_t
+            h_from = get_hops(reachable, is_depot, n_steps)[consumers]
+            h_to = get_hops(reachable.T, is_depot, n_steps)[consumers]
+            v_serve = ((h_from[:, np.newaxis] <= steps)
+                       & (h_to[:, np.newaxis] <= n_steps-1-steps)
+                       & (steps >= 1) & (steps <= n_steps-2))
+            serve[speed == v_speed] = v_serve
+        self.cap = serve * P_vn[:, :, np.newaxis]
+
+        # deficits of consumers at times 1..n_steps, 
+        # energy available from producers until then
+        E_c = mod.E_nt[consumers, :n_steps]
+        self.deficit = np.maximum(np.cumsum(E_c, axis=1)
+                                  - mod.s_n0[consumers, np.newaxis], 0)
+        E_p = mod.E_nt[mod.producers, :n_steps]
+        self.produced = (np.cumsum(E_p, axis=1).sum(axis=0) 
+                         + mod.s_n0[mod.producers].sum())
+
+
+    def check(self, v_set):
+        '''
+        Check the necessary conditions for a vehicle set.
+
+        Args:
+            v_set (list): list of vehicle indices
+        Returns:
+            reason (str): violated condition, None if all are met
+        '''
+        cap = self.cap[list(v_set)]
+        if self.limit_vehicles:
+            # fractional share of the vehicles ranked by power
+            ranks = np.arange(cap.shape[0])[:, np.newaxis]
+            share = np.clip(self.n_charge - ranks, 0, 1)
+            node_cap = (-np.sort(-cap, axis=0) 
+                        * share[:, :, np.newaxis]).sum(axis=0)
+        else: 
+            node_cap = cap.sum(axis=0)
+        short = self.deficit - np.cumsum(node_cap, axis=1) > self.tol
+        if short.any():
+            n, t = np.argwhere(short)[0]
+            return 'supply of consumer {} at t={}'.format(
+                   self.names[n], t+1)
+        total = self.deficit.sum(axis=0)
+        vehicle_cap = np.cumsum(cap.max(axis=1).sum(axis=0))
+        if (total - vehicle_cap > self.tol).any():
+            return 'throughput of vehicles'
+        energy = self.s_v0[list(v_set)].sum() + self.produced
+        if (total - energy > self.tol).any():
+            return 'available energy'
+
+        return None
 
 
 def remove_duplicates(tuple_list,names):
@@ -516,15 +1033,14 @@ def remove_duplicates(tuple_list,names):
 
     # remove additional duplicates due to correlating entries in names
     result = []
-    result_names = [] 
+    result_names = set() 
     for item in duplicate_free:
         # no index is allowed more than once
         if len(item) != len(set(item)):
             continue
-        item_names = [names[i] for i in item]
-        item_names.sort()
+        item_names = tuple(sorted(names[i] for i in item))
         if item_names not in result_names:
-            result_names.append(item_names)
+            result_names.add(item_names)
             result.append(item)
         else:
             continue
@@ -532,42 +1048,97 @@ def remove_duplicates(tuple_list,names):
     return result
 
 
-def findTriplets(lst, costs, key):
+def swap_candidates(unused, names, costs, t_eff, max_costs, max_size=3):
     '''
-    Find all triplet-combinations in list 
-    whose costs are smaller than some key
+    Lazily generate combinations of 1 to *max_size* unused vehicles 
+    with combined costs lower than *max_costs*, in descending order 
+    of their combined throughput.
+    Vehicles of the same name are considered identical, i.e. 
+    each combination of names is only generated once.
+    Combinations are index-tuples i_1 <= i_2 <= ... of vehicle types 
+    sorted by throughput. They are explored best-first via a heap, 
+    since increasing any index can only decrease the throughput.
+    Subtrees that cannot satisfy the cost bound are pruned.
 
     Args:
-        lst (list): list of indices
-        costs (list): list of corresponding costs
-        key (float): bound for costs of triplet-combinations
-    Returns:
-        triplets (list): list of triplets featuring 
-                         lower costs than key
-    '''   
-    def valid(val): 
-        cost_list = [costs[i] for i in val] 
-        return sum(cost_list) < key 
-
-    triplets = list(filter(valid, list(combinations(lst, 3)))) 
-
-    return triplets
+        unused (list): indices of vehicles that can be added
+        names (pd.Series): names of all vehicles
+        costs (pd.Series): costs of all vehicles
+        t_eff (pd.Series): effective throughput of all vehicles
+        max_costs (float): upper bound for the combined costs
+        max_size (int): maximum number of vehicles combined
+    Yields:
+        c (tuple): indices of the combined vehicles
+        c_values (list): combined costs and throughput
+    '''
+    # group affordable vehicles by name
+    groups = {}
+    for i in unused:
+        if costs[i] < max_costs:
+            groups.setdefault(names[i], []).append(i)
+    types = sorted(groups.values(), key=lambda g: t_eff[g[0]], 
+                   reverse=True)
+    n_types = len(types)
+    type_costs = [costs[g[0]] for g in types]
+    type_effs = [t_eff[g[0]] for g in types]
+    # lowest costs of all types from index i onwards
+    min_costs = np.minimum.accumulate(type_costs[::-1])[::-1].tolist()
+
+    heap = []
+    seen = set()
+    def push(item):
+        if item in seen:
+            return
+        seen.add(item)
+        # all successors only feature types with higher indices 
+        if sum(min_costs[i] for i in item) >= max_costs:
+            return
+        heapq.heappush(heap, (-sum(type_effs[i] for i in item), item))
+
+    if n_types > 0:
+        for size in range(1, max_size+1):
+            push((0,)*size)
+    while heap:
+        neg_eff, item = heapq.heappop(heap)
+        for j in range(len(item)):
+            if (item[j]+1 < n_types and 
+                (j == len(item)-1 or item[j]+1 <= item[j+1])):
+                push(item[:j] + (item[j]+1,) + item[j+1:])
+        c_costs = sum(type_costs[i] for i in item)
+        if c_costs >= max_costs:
+            continue
+        # take the first available vehicles of each type
+        c = []
+        counts = {}
+        for i in item:
+            counts[i] = counts.get(i, 0) + 1
+            if counts[i] > len(types[i]):
+                break
+            c.append(types[i][counts[i]-1])
+        if len(c) < len(item):
+            continue
+        yield tuple(c), [c_costs, -neg_eff]
 
 
 ###########
 # VISUALS #
 ###########
-def read_results(out_file, s_n0=None, s_v0=None, nodes=None, vehicles=None):
+def read_results(out_file, s_n0=None, s_v0=None, nodes=None, vehicles=None, 
+                 skip_zeros=False):
     '''
     Read results obtained by gurobi and 
     return them as dictionaries for further use.
+    The file is parsed via read_result_arrays(). 
+    Results of npz-files or read with skip_zeros are sparse, 
+    i.e. entries that are not stored are zero.
 
     Args:
-        out_file (str): path of txt-file containing results
+        out_file (str): path of npz- or txt-file containing results
         s_n0 (list): list of initial storage values for nodes
         s_v0 (list): list of initial storage values for vehicles
         nodes (list): index-list for nodes
         vehicles (list): index-list for vehicles
+        skip_zeros (bool): omit zero values of txt-files
         
     Returns:
         s_nt (dict): stored energy at all locations and times
@@ -577,55 +1148,26 @@ def read_results(out_file, s_n0=None, s_v0=None, nodes=None, vehicles=None):
         w_vnmt (dict): 1 if vehicle v is moving 
                        from n to m at time t, 0 else
     '''
+    arrays = read_result_arrays(out_file, skip_zeros)
+    sparse = skip_zeros or out_file.endswith('.npz')
 
-    s_nt = {}  
-    s_vt = {}
-    f_vnt = {}
-    w_vnmt = {}
-    z_v = {}
-    e_nt = {}
-
-    with open(out_file, 'r') as my_file:
-        lines = my_file.readlines()
-
+    results = {}
     counter = 0
-    for line in lines:
-        var, val = line.split(' ')
-        val = float(val)
-        if var[:3] == 'z_v':
-            counter += 1
-            ind = var[3:].replace('[','').replace(']',
-                                                  '').split(',')
-            z_v[int(ind[0])] = val
-        if var[:4] == 'e_nt':
-            counter += 1
-            ind = var[4:].replace('[','').replace(']',
-                                                  '').split(',')
-            e_nt[int(ind[0]),int(ind[1])] = val
-        elif var[:4] == 's_nt':
-            counter += 1
-            ind = var[4:].replace('[','').replace(']',
-                                                  '').split(',')
-            s_nt[int(ind[0]),int(ind[1])] = val
-        elif var[:4] == 's_vt':
-            counter += 1
-            ind = var[4:].replace('[','').replace(']',
-                                                  '').split(',')
-            s_vt[int(ind[0]),int(ind[1])] = val
-        elif var[:5] == 'f_vnt':
-            counter += 1
-            ind = var[5:].replace('[','').replace(']',
-                                                  '').split(',')
-            f_vnt[int(ind[0]), int(ind[1]), int(ind[2])] = val
-        elif var[:6] == 'w_vnmt':
-            counter += 1
-            ind = var[6:].replace('[','').replace(']',
-                                                  '').split(',')
-            w_vnmt[int(ind[0]), int(ind[1]), 
-                   int(ind[2]), int(ind[3])] = val
+    for var, (ind, val) in arrays.items():
+        counter += len(val)
+        if solution_vars[var] == 1:
+            keys = ind[:, 0].tolist()
+        else:
+            keys = map(tuple, ind.tolist())
+        if sparse:
+            results[var] = defaultdict(float, zip(keys, val.tolist()))
+        else:
+            results[var] = dict(zip(keys, val.tolist()))
 
     print(f'\nRead {counter} values from {out_file}...\n')
 
+    s_nt = results['s_nt']
+    s_vt = results['s_vt']
     if nodes is not None:
         for n in nodes:
             if s_n0 is not None:
@@ -635,7 +1177,129 @@ def read_results(out_file, s_n0=None, s_v0=None, nodes=None, vehicles=None):
             if s_v0 is not None:
                 s_vt[v,0] = s_v0[v]
     
-    return w_vnmt, s_nt, s_vt, f_vnt, z_v, e_nt
+    return (results['w_vnmt'], s_nt, s_vt, results['f_vnt'], 
+            results['z_v'], results['e_nt'])
+
+
+def read_result_arrays(out_file, skip_zeros=False):
+    '''
+    Read results as arrays. 
+    Txt-files are parsed in bulk by pandas 
+    and split into arrays per variable.
+
+    Args:
+        out_file (str): path of npz- or txt-file containing results
+        skip_zeros (bool): omit zero values of txt-files
+    Returns:
+        arrays (dict): {var: (ind, val)} for var in solution_vars, 
+                       ind (np.array): indices, one row per entry
+                       val (np.array): values
+    '''
+    arrays = {}
+    if out_file.endswith('.npz'):
+        with np.load(out_file) as npz:
+            for var in solution_vars:
+                arrays[var] = (npz[var + '_ind'], npz[var + '_val'])
+        return arrays
+
+    # 'w_vnmt[0,1,2,3] 1' -> 'w_vnmt,0,1,2,3,1', parsed at once
+    with open(out_file, 'r') as my_file:
+        text = my_file.read().replace('[', ',').replace('] ', ',')
+    n_cols = max(solution_vars.values()) + 2
+    frame = pd.read_csv(io.StringIO(text), header=None, 
+                        names=range(n_cols), 
+                        float_precision='round_trip')
+    names = frame[0].values
+    for var, n_ind in solution_vars.items():
+        values = frame[names == var]
+        ind = values.iloc[:, 1:n_ind+1].values.astype(np.int32)
+        val = values.iloc[:, n_ind+1].values.astype(np.float64)
+        if skip_zeros:
+            ind, val = ind[val != 0], val[val != 0]
+        arrays[var] = (ind, val)
+
+    return arrays
+
+
+# variables stored in solution files and their number of indices
+solution_vars = {'w_vnmt': 4, 'f_vnt': 3, 's_nt': 2, 's_vt': 2, 
+                 'z_v': 1, 'e_nt': 2}
+
+
+def write_solution(out_file, values, compress=True):
+    '''
+    Write a solution as npz-file, which only contains 
+    the non-zero entries of each variable as an integer array 
+    of indices (one row per entry) and a float array of values.
+
+    Args:
+        out_file (str): path of npz-file
+        values (dict): dictionary of the form {var: {index: value}}
+                       for var in solution_vars
+        compress (bool): compress the npz-file
+    '''
+    arrays = {}
+    for var in solution_vars:
+        var_values = values.get(var) or {}
+        items = [(ind, val) for ind, val in var_values.items() 
+                 if val != 0]
+        ind = np.array([i if isinstance(i, tuple) else (i,) 
+                        for i, _ in items], dtype=np.int32)
+        arrays[var] = (ind.reshape(len(items), solution_vars[var]), 
+                       np.array([val for _, val in items], 
+                                dtype=np.float64))
+    write_solution_arrays(out_file, arrays, compress)
+
+
+def write_solution_arrays(out_file, arrays, compress=True):
+    '''
+    Write a solution given as arrays, see read_result_arrays().
+    '''
+    npz_arrays = {}
+    for var, (ind, val) in arrays.items():
+        npz_arrays[var + '_ind'] = ind.astype(np.int32)
+        npz_arrays[var + '_val'] = val.astype(np.float64)
+    if compress:
+        np.savez_compressed(out_file, **npz_arrays)
+    else:
+        np.savez(out_file, **npz_arrays)
+
+
+def convert_results(directory, compress=True, remove=False):
+    '''
+    Convert all txt-results below *directory* which are 
+    accompanied by a pickled model (.p) to npz-solutions.
+
+    Args:
+        directory (str): e.g. 'showroom'
+        compress (bool): compress the npz-files
+        remove (bool): delete txt-files after conversion
+    '''
+    for p_file in glob.glob(os.path.join(directory, '**', '*.p'), 
+                            recursive=True):
+        root = os.path.splitext(p_file)[0]
+        if not os.path.isfile(root + '.txt'):
+            continue
+        arrays = read_result_arrays(root + '.txt', skip_zeros=True)
+        write_solution_arrays(root + '.npz', arrays, compress)
+        print('{} -> {} ({:.0f} kB -> {:.0f} kB)'.format(
+              root + '.txt', root + '.npz', 
+              os.path.getsize(root + '.txt') / 1e3, 
+              os.path.getsize(root + '.npz') / 1e3))
+        if remove:
+            os.remove(root + '.txt')
+
+
+def get_result_file(root):
+    '''
+    Return the results belonging to a pickled model *root*.p,
+    preferring npz-solutions over txt-files.
+    '''
+    for ext in ['.npz', '.txt']:
+        if os.path.exists(root + ext):
+            return root + ext
+
+    return None
 
 
 def preprocess_vars(w, f_grb, vehicles, times, nodes):
@@ -687,3 +1351,20 @@ def preprocess_vars(w, f_grb, vehicles, times, nodes):
                     except KeyError:
                         pass
     return x,f,v_list
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+             description='Convert txt-results to npz-solutions.')
+    parser.add_argument('-d', '--directory', 
+                        dest='directory', default='showroom', 
+                        help='Directory to be converted recursively')
+    parser.add_argument('-u', '--uncompressed', action='store_true', 
+                        dest='uncompressed', 
+                        help='Do not compress npz-files')
+    parser.add_argument('-r', '--remove', action='store_true', 
+                        dest='remove', 
+                        help='Delete txt-files after conversion')
+    args = parser.parse_args()
+
+    convert_results(args.directory, not args.uncompressed, args.remove)
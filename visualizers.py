@@ -649,12 +649,10 @@ if __name__ == "__main__":
                               ' to be visualized'))
     args = parser.parse_args()
 
-    txt_path = args.name + '.txt'
+    res_path = get_result_file(args.name)
     p_path = args.name + '.p'
-    if os.path.exists(txt_path):
-        pass
-    else:
-        exit('{} does not exist'.format(txt_path))
+    if res_path is None:
+        exit('{}.npz/.txt does not exist'.format(args.name))
     if os.path.exists(p_path):
         pass
     else:
@@ -662,7 +660,7 @@ if __name__ == "__main__":
     
     with open(p_path,'rb') as pickle_file:
         model_dict = pickle.load(pickle_file)
-    my_vis = visuals(model_dict, txt_path)
+    my_vis = visuals(model_dict, res_path)
     my_vis.time_series_plots()
     my_vis.interactive_plot()
     plt.show()